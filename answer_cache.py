@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.runnables import RunnableGenerator
+from query_router import course_codes
+
+# How long answers stay valid, how many are kept, and how close a paraphrase must be to reuse one
+answer_cache_ttl = float(os.getenv("answer_cache_ttl", "3600"))
+answer_cache_size = int(os.getenv("answer_cache_size", "1000"))
+answer_cache_threshold = float(os.getenv("answer_cache_threshold", "0.95"))
+
+
+def normalize_question(question):
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+def question_identity(question):
+    # Course numbers and other numbers (sections, dates, years) name what a question is about; two questions that
+    # differ in them ask about different things however close their embeddings are
+    text = question.lower()
+    return frozenset(course_codes(text)), frozenset(re.findall(r"\d+", text))
+
+
+class AnswerCache:
+    """Answers keyed on the standalone question, matched exactly or by embedding similarity.
+
+    Entries expire after `ttl` seconds and the least recently used are evicted beyond
+    `max_entries`. Question vectors sit in a preallocated matrix, so a semantic lookup is a
+    single matrix-vector product. A semantic match must also name the same course numbers and
+    other numbers as the question. If `version_fn` is given, the cache empties itself whenever
+    its value changes, e.g. when vectordb.py bumps the index manifest's generation.
+    """
+
+    def __init__(self, embeddings, ttl=answer_cache_ttl, max_entries=answer_cache_size,
+                 threshold=answer_cache_threshold, version_fn=None):
+        self.embeddings = embeddings
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.version_fn = version_fn
+        self.version = version_fn() if version_fn else None
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.vectors = None
+        self.valid = np.zeros(max_entries, dtype=bool)
+        self.slot_keys = [None] * max_entries
+        self.slot_identities = [None] * max_entries
+        self.metrics = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _remove(self, key):
+        slot = self.entries.pop(key)[0]
+        self.valid[slot] = False
+        self.slot_keys[slot] = None
+        self.slot_identities[slot] = None
+
+    def _check_version(self):
+        if self.version_fn is not None:
+            version = self.version_fn()
+            if version != self.version:
+                self.invalidate()
+                self.version = version
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.valid[:] = False
+            self.slot_keys = [None] * self.max_entries
+            self.slot_identities = [None] * self.max_entries
+            self.metrics["invalidations"] += 1
+
+    def lookup(self, question):
+        """Return the cached answer for this or a near-identical question, or None."""
+        self._check_version()
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] > now:
+                self.entries.move_to_end(key)
+                self.metrics["exact_hits"] += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            has_entries = bool(self.entries)
+
+        if has_entries:
+            vector = self._embed(question)
+            identity = question_identity(question)
+            with self.lock:
+                scores = self.vectors @ vector
+                scores[~self.valid] = -np.inf
+                # Candidates above the threshold, best first; usually there are none or a handful
+                candidates = np.flatnonzero(scores >= self.threshold)
+                for slot in candidates[np.argsort(-scores[candidates])]:
+                    match = self.slot_keys[slot]
+                    if match is not None and self.slot_identities[slot] == identity and self.entries[match][2] > now:
+                        self.entries.move_to_end(match)
+                        self.metrics["semantic_hits"] += 1
+                        return self.entries[match][1]
+
+        with self.lock:
+            self.metrics["misses"] += 1
+        return None
+
+    def store(self, question, answer):
+        vector = self._embed(question)
+        key = normalize_question(question)
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if key in self.entries:
+                self._remove(key)
+            if len(self.entries) >= self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.metrics["evictions"] += 1
+            slot = int(np.flatnonzero(~self.valid)[0])
+            self.vectors[slot] = vector
+            self.valid[slot] = True
+            self.slot_keys[slot] = key
+            self.slot_identities[slot] = question_identity(question)
+            self.entries[key] = (slot, answer, time.monotonic() + self.ttl)
+
+    def stats(self):
+        with self.lock:
+            hits = self.metrics["exact_hits"] + self.metrics["semantic_hits"]
+            lookups = hits + self.metrics["misses"]
+            return {**self.metrics, "entries": len(self.entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+
+def cache_answers(answer_cache):
+    """Pass-through chain step that stores each generated answer once it has finished streaming."""
+
+    def collect(state, chunk):
+        state["question"] = chunk.get("standalone_question", state["question"])
+        if "answer" in chunk:
+            state["parts"].append(chunk["answer"])
+
+    def store(state):
+        if state["question"] is not None and state["parts"]:
+            answer_cache.store(state["question"], "".join(state["parts"]))
+
+    def transform(chunks):
+        state = {"question": None, "parts": []}
+        for chunk in chunks:
+            collect(state, chunk)
+            yield chunk
+        store(state)
+
+    async def atransform(chunks):
+        state = {"question": None, "parts": []}
+        async for chunk in chunks:
+            collect(state, chunk)
+            yield chunk
+        await asyncio.get_running_loop().run_in_executor(None, store, state)
+
+    return RunnableGenerator(transform, atransform)
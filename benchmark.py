@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import zlib
+import asyncio
+import argparse
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from stage_metrics import metrics
+from local_index import LocalVectorIndex, LocalVectorStore
+from hybrid_retriever import BM25Index
+from indexing import index_dataset, state_paths
+from timetable import TimetableIndex
+from answer_cache import AnswerCache
+from session_store import SessionStore
+from rag_chain import build_retriever, build_rag_chain, answer_query, contextualize_q_system_prompt
+
+# Replays a recorded query set through the real pipeline on local fakes, so runs need no API keys
+# and their numbers only move when this code does
+default_queries_path = os.getenv("benchmark_queries_path", "benchmark_queries.jsonl")
+
+# Stages whose p50/p99 may grow by this fraction over the baseline, and by at least this many ms, before --compare fails
+regression_tolerance = 0.2
+regression_floor_ms = 1.0
+
+_word = re.compile(r"\w+")
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words vectors with a simulated request latency.
+
+    Texts sharing words get similar vectors, so retrieval still returns related chunks.
+    """
+
+    def __init__(self, dim=256, latency=0.02, per_text_latency=0.0002):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _word.findall(text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Streams a canned answer with a simulated time to first token and inter-token delay.
+
+    The answer is `answer_tokens` words cycled from the question.
+    """
+
+    first_token_latency: float = 0.2
+    token_latency: float = 0.005
+    answer_tokens: int = 50
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _tokens(self, messages):
+        # Question rewrites come back unchanged, so routing and retrieval see the recorded question
+        if messages[0].content == contextualize_q_system_prompt:
+            return [f"{word} " for word in _word.findall(messages[-1].content)]
+        words = _word.findall(messages[-1].content) or ["answer"]
+        return [f"{words[i % len(words)]} " for i in range(self.answer_tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = "".join(chunk.message.content for chunk in self._stream(messages, stop, run_manager, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def load_queries(path=default_queries_path):
+    # Recorded turns in the server's request format, {"session_id": ..., "input": ...} per line, grouped by session
+    sessions = OrderedDict()
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                turn = json.loads(line)
+                sessions.setdefault(turn["session_id"], []).append(turn["input"])
+    return sessions
+
+
+def run_ingestion(embeddings, index, state_dir, sources=None, max_workers=None):
+    """Index the dataset with the pipeline `vectordb.py` runs, keeping its manifest and indexes in `state_dir`."""
+    index_target = {"backend": "local", "location": os.path.abspath(index.index_dir)}
+    start = time.perf_counter()
+    counts = index_dataset(embeddings, index, index_target, full=True, sources=sources, max_workers=max_workers, state_dir=state_dir)
+    wall = time.perf_counter() - start
+    pages = metrics.summary().get("extract_page", {}).get("count", 0)
+    chunks = counts["index_chunks"] + counts["index_duplicates"]
+    report = {"wall_s": round(wall, 3), "pages": pages, "chunks": chunks, "duplicates": counts["index_duplicates"],
+              "embedded": counts["chunks_embedded"], "pages_per_s": round(pages / wall, 2), "chunks_per_s": round(chunks / wall, 2)}
+    return BM25Index.load(state_paths(state_dir)["sparse"]), report
+
+
+def run_chat(chain, timetable_index, get_session_history, sessions, concurrency=1):
+    """Replay every session's turns in order, with up to `concurrency` sessions at once."""
+
+    def replay(item):
+        session_id, turns = item
+        for question in turns:
+            answer_query(chain, timetable_index, get_session_history, question, session_id)
+        return len(turns)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        queries = sum(pool.map(replay, sessions.items()))
+    wall = time.perf_counter() - start
+    return {"wall_s": round(wall, 3), "queries": queries, "sessions": len(sessions), "concurrency": concurrency,
+            "queries_per_s": round(queries / wall, 2)}
+
+
+def compare(report, baseline, tolerance=regression_tolerance, floor_ms=regression_floor_ms):
+    """Lines describing every stage latency or phase throughput that got worse than the baseline allows."""
+    regressions = []
+    for stage, stats in report["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if stats[key] > old[key] * (1 + tolerance) and stats[key] - old[key] > floor_ms:
+                regressions.append(f"{stage} {key}: {old[key]} -> {stats[key]}")
+    for phase, stats in report["phases"].items():
+        old = baseline["phases"].get(phase, {})
+        for key in ("pages_per_s", "chunks_per_s", "queries_per_s"):
+            if key in stats and old.get(key) and stats[key] < old[key] / (1 + tolerance):
+                regressions.append(f"{phase} {key}: {old[key]} -> {stats[key]}")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'stage':<24}{'count':>8}{'p50 ms':>12}{'p99 ms':>12}{'per s':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<24}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p99_ms']:>12}{stats['per_s'] or '-':>10}")
+    for phase, stats in report["phases"].items():
+        print(f"{phase}: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and chat on local fake embedding, vector-store and LLM backends.")
+    parser.add_argument("--queries", default=default_queries_path, help="recorded turns, one JSON object per line")
+    parser.add_argument("--sources", nargs="*", help="only ingest these files (default: every source file)")
+    parser.add_argument("--workers", type=int, help="extraction processes (default: one per CPU core)")
+    parser.add_argument("--concurrency", type=int, default=1, help="sessions replayed at once")
+    parser.add_argument("--index-mode", default="flat", choices=["flat", "ivf"], help="local vector index mode")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds per fake embedding request")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="seconds before the fake LLM's first token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="seconds between the fake LLM's tokens")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline report to check this run against; exits with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=regression_tolerance, help="allowed slowdown as a fraction")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(latency=args.embed_latency)
+    llm = FakeChatModel(first_token_latency=args.first_token_latency, token_latency=args.token_latency)
+    metrics.reset()
+    with tempfile.TemporaryDirectory() as state_dir:
+        index = LocalVectorIndex(index_dir=os.path.join(state_dir, "index"), mode=args.index_mode)
+        sparse_index, ingestion_report = run_ingestion(embeddings, index, state_dir, args.sources or None, args.workers)
+
+        # The chain is the one retriever.py builds, with the fakes in place of OpenAI and Pinecone
+        retriever = build_retriever(LocalVectorStore(index=index, embedding=embeddings), sparse_index)
+        answer_cache = AnswerCache(embeddings)
+        store = SessionStore()
+        chain = build_rag_chain(llm, llm, retriever, answer_cache, store.get)
+        chat_report = run_chat(chain, TimetableIndex.load(), store.get, load_queries(args.queries), args.concurrency)
+        chat_report["answer_cache"] = answer_cache.stats()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "tolerance")},
+        "phases": {"ingestion": ingestion_report, "chat": chat_report},
+        "stages": metrics.summary(),
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Note: the baseline was run with different settings, so its numbers may not be comparable.")
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against the baseline.")
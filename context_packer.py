@@ -0,0 +1,135 @@
+import os
+import re
+import math
+from collections import Counter
+from typing import Any
+from langchain_core.documents import BaseDocumentCompressor, Document
+from hybrid_retriever import tokenize, tokenize_query
+from tokens import count_tokens
+
+# Prompt tokens the retrieved context may take in total, and at most per chunk
+context_token_budget = int(os.getenv("context_token_budget", "1200"))
+chunk_token_limit = int(os.getenv("chunk_token_limit", "400"))
+# 1.0 ranks on relevance alone; lower values favour chunks that add something new
+mmr_lambda = float(os.getenv("mmr_lambda", "0.7"))
+
+_blank_lines = re.compile(r"\n\s*\n")
+
+
+def _passages(text, passage_chars):
+    # Paragraphs, with long ones cut at line breaks into pieces of about passage_chars
+    passages = []
+    for paragraph in _blank_lines.split(text):
+        piece = ""
+        for line in paragraph.splitlines(keepends=True):
+            if piece and len(piece) + len(line) > passage_chars:
+                passages.append(piece)
+                piece = ""
+            piece += line
+        if piece.strip():
+            passages.append(piece)
+    return passages
+
+
+class ContextPacker(BaseDocumentCompressor):
+    """Reranks retrieved chunks, trims them to their relevant passages and packs them into a token budget.
+
+    Chunks are scored with BM25 against the query, blended with their retrieval rank, and
+    picked by maximal marginal relevance so near-identical chunks do not crowd out the rest.
+    A chunk over `chunk_token_limit` keeps only its best passages, in document order, and the
+    picked chunks are added until `token_budget` is spent. Everything is local and lexical, so
+    packing costs well under a millisecond per chunk. IDF comes from `sparse_index` (the BM25
+    index built by vectordb.py) when given, otherwise from the retrieved chunks themselves.
+    """
+
+    sparse_index: Any = None
+    token_budget: int = context_token_budget
+    chunk_token_limit: int = chunk_token_limit
+    mmr_lambda: float = mmr_lambda
+    passage_chars: int = 400
+    min_chunk_tokens: int = 100
+
+    def _idf(self, term, doc_counts):
+        if self.sparse_index is not None and len(self.sparse_index):
+            total, df = len(self.sparse_index), len(self.sparse_index.postings.get(term, ()))
+        else:
+            total, df = len(doc_counts), sum(1 for counts in doc_counts if term in counts)
+        return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+    def _relevance(self, query_terms, doc_counts, idf):
+        # BM25 of each chunk, scaled to [0, 1] and blended with the retriever's own ranking
+        lengths = [sum(counts.values()) for counts in doc_counts]
+        avg_length = sum(lengths) / len(lengths) or 1.0
+        scores = []
+        for counts, length in zip(doc_counts, lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term, 0)
+                if tf:
+                    score += idf[term] * tf * 2.5 / (tf + 1.5 * (0.25 + 0.75 * length / avg_length))
+            scores.append(score)
+        best = max(scores) or 1.0
+        return [0.5 * score / best + 0.5 * (1 - rank / len(scores)) for rank, score in enumerate(scores)]
+
+    def _select(self, relevance, doc_terms):
+        # Maximal marginal relevance with Jaccard similarity of the chunks' terms
+        remaining, order = list(range(len(relevance))), []
+        while remaining:
+            def mmr(i):
+                redundancy = max((len(doc_terms[i] & doc_terms[j]) / (len(doc_terms[i] | doc_terms[j]) or 1) for j in order), default=0.0)
+                return self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * redundancy
+            best = max(remaining, key=mmr)
+            order.append(best)
+            remaining.remove(best)
+        return order
+
+    def _trim(self, doc, query_terms, idf, max_tokens):
+        passages = _passages(doc.page_content, self.passage_chars)
+        # A table chunk starts with its title and header, which every row needs
+        keep_first = "table" in doc.metadata
+        scored = sorted(range(len(passages)), key=lambda i: (i != 0 or not keep_first,
+                        -sum(idf.get(term, 0.0) for term in set(tokenize(passages[i])) & query_terms), i))
+        kept, tokens = set(), 0
+        for i in scored:
+            passage_tokens = count_tokens(passages[i])
+            if tokens + passage_tokens > max_tokens:
+                continue
+            kept.add(i)
+            tokens += passage_tokens
+        if not kept:
+            if not passages:
+                return None, 0
+            # Not even one passage fits, so the best one is cut down to the budget
+            text = passages[scored[0]].strip()[:max_tokens * 4]
+            return Document(id=doc.id, page_content=text, metadata={**doc.metadata, "trimmed": True}), count_tokens(text)
+        text = "\n...\n".join(passages[i].strip() for i in sorted(kept))
+        return Document(id=doc.id, page_content=text, metadata={**doc.metadata, "trimmed": True}), tokens
+
+    def compress_documents(self, documents, query, callbacks=None):
+        if not documents:
+            return []
+        query_terms = set(tokenize_query(query))
+        doc_counts = [Counter(tokenize(doc.page_content)) for doc in documents]
+        idf = {term: self._idf(term, doc_counts) for term in query_terms}
+        relevance = self._relevance(query_terms, doc_counts, idf)
+        order = self._select(relevance, [set(counts) for counts in doc_counts])
+
+        packed, used = [], 0
+        for i in order:
+            doc = documents[i]
+            remaining = self.token_budget - used
+            # Past this point a chunk would be cut down to a few lines that rarely help
+            if remaining < self.min_chunk_tokens:
+                break
+            tokens = count_tokens(doc.page_content)
+            if tokens > min(self.chunk_token_limit, remaining):
+                doc, tokens = self._trim(doc, query_terms, idf, min(self.chunk_token_limit, remaining))
+                if doc is None:
+                    continue
+            packed.append(doc)
+            used += tokens
+        return packed
+
+    async def acompress_documents(self, documents, query, callbacks=None):
+        # Packing is cheap enough to run inline rather than on an executor thread
+        return self.compress_documents(documents, query, callbacks)
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import zlib
+from collections import defaultdict
+import numpy as np
+
+# Signatures of the indexed chunks, saved by vectordb.py next to the other indexes
+dedup_index_path = os.getenv("dedup_index_path", "dedup_index.json")
+
+# Estimated Jaccard similarity of word shingles above which two chunks count as the same text
+dedup_threshold = float(os.getenv("dedup_threshold", "0.8"))
+
+# 128 hash functions in 16 bands of 8 rows: pairs above ~0.7 similarity almost always share a band
+num_perm = 128
+num_bands = 16
+shingle_size = 3
+
+_word = re.compile(r"\w+")
+# Cross-listed courses share everything but their course numbers, so chunks naming different ones never merge
+_course_code = re.compile(r"\b([a-z]{2,5})\s*([a-z])\s*(\d{3})\b")
+_prime = (1 << 31) - 1
+# Fixed seed, so signatures saved by one run stay comparable with the next
+_rng = np.random.default_rng(42)
+_a = _rng.integers(1, _prime, num_perm, dtype=np.uint64)
+_b = _rng.integers(0, _prime, num_perm, dtype=np.uint64)
+
+
+def minhash(text):
+    words = _word.findall(text.lower())
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) & _prime for shingle in shingles), dtype=np.uint64)
+    return ((_a[:, None] * hashes[None, :] + _b[:, None]) % _prime).min(axis=1).astype(np.uint32)
+
+
+def course_codes(text):
+    return " ".join(sorted({"".join(parts) for parts in _course_code.findall(text.lower())}))
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of the chunks that have a vector, used to skip near-duplicates before embedding.
+
+    `add` returns the label of an earlier chunk whose text is near-identical, in which case
+    the new chunk is only recorded as its duplicate and never embedded. Otherwise the chunk
+    becomes canonical and later chunks are compared against it. Canonical chunks that are
+    removed or whose text changes are remembered in `invalidated`, so the caller can re-index
+    the duplicates that pointed at them.
+    """
+
+    def __init__(self, threshold=dedup_threshold, signatures=None, codes=None, duplicates=None, sources=None):
+        self.threshold = threshold
+        self.signatures = {label: np.asarray(signature, dtype=np.uint32) for label, signature in (signatures or {}).items()}
+        self.codes = codes or {}
+        self.duplicates = duplicates or {}
+        self.sources = sources or {}
+        self.buckets = defaultdict(set)
+        for label, signature in self.signatures.items():
+            self._bucket(label, signature, add=True)
+        self.invalidated = set()
+        self.touched = set()
+
+    @classmethod
+    def load(cls, path=dedup_index_path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(signatures=data["signatures"], codes=data["codes"], duplicates=data["duplicates"], sources=data["sources"])
+
+    def save(self, path=dedup_index_path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"signatures": {label: signature.tolist() for label, signature in self.signatures.items()},
+                       "codes": self.codes, "duplicates": self.duplicates, "sources": self.sources}, f)
+        os.replace(tmp_path, path)
+
+    def _bucket(self, label, signature, add):
+        rows = num_perm // num_bands
+        for band in range(num_bands):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            if add:
+                self.buckets[key].add(label)
+            else:
+                self.buckets[key].discard(label)
+                if not self.buckets[key]:
+                    del self.buckets[key]
+
+    def _forget(self, label):
+        # Drop whatever is recorded for label, returning its old signature if it was canonical
+        if label in self.duplicates:
+            self.touched.add(self.duplicates.pop(label))
+        signature = self.signatures.pop(label, None)
+        if signature is not None:
+            self._bucket(label, signature, add=False)
+        self.codes.pop(label, None)
+        self.sources.pop(label, None)
+        return signature
+
+    def add(self, label, text, source):
+        """Record a chunk; returns the canonical label it duplicates, or None if it needs its own vector."""
+        signature, codes = minhash(text), course_codes(text)
+        old_signature = self._forget(label)
+        rows = num_perm // num_bands
+        candidates = set()
+        for band in range(num_bands):
+            candidates |= self.buckets.get((band, signature[band * rows:(band + 1) * rows].tobytes()), set())
+        best, best_score = None, self.threshold
+        for candidate in sorted(candidates):
+            if self.codes[candidate] != codes:
+                continue
+            score = float(np.mean(self.signatures[candidate] == signature))
+            if score >= best_score:
+                best, best_score = candidate, score
+
+        self.sources[label] = source
+        if best is not None:
+            self.duplicates[label] = best
+            self.touched.add(best)
+            if old_signature is not None:
+                self.invalidated.add(label)
+            return best
+        self.signatures[label] = signature
+        self.codes[label] = codes
+        self._bucket(label, signature, add=True)
+        if old_signature is not None and not np.array_equal(old_signature, signature):
+            self.invalidated.add(label)
+        return None
+
+    def remove(self, labels):
+        for label in labels:
+            if self._forget(label) is not None:
+                self.invalidated.add(label)
+
+    def take_orphans(self):
+        """Labels of duplicates whose canonical chunk changed or went away since the last call."""
+        orphans = {label for label, canonical in self.duplicates.items() if canonical in self.invalidated}
+        self.invalidated = set()
+        return orphans
+
+    def groups(self):
+        # Canonical label -> labels of its duplicates
+        groups = defaultdict(list)
+        for label, canonical in self.duplicates.items():
+            groups[canonical].append(label)
+        return groups
+
+    def merged_metadata(self, label, groups):
+        duplicates = sorted(groups.get(label, []))
+        sources = sorted({self.sources[label]} | {self.sources[duplicate] for duplicate in duplicates})
+        return {"sources": sources, "duplicates": duplicates}
+
+    def __len__(self):
+        return len(self.signatures)
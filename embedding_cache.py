@@ -0,0 +1,180 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Where cached vectors live and how many vectors each model may keep before the least recently used are evicted
+embedding_cache_dir = os.getenv("embedding_cache_dir", ".embedding_cache")
+embedding_cache_size = int(os.getenv("embedding_cache_size", "20000"))
+
+
+def normalize_text(text):
+    # Collapse whitespace so trivially different copies of a chunk or query share one entry
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Persistent LRU cache of float32 embeddings for a single model.
+
+    Vectors are stored in a fixed-size memory-mapped matrix with one row per entry. An SQLite
+    table maps each key to its row and records when it was last used. Rows are written and read
+    inside an SQLite write transaction, so the ingestion script and the chatbot can share a cache.
+    """
+
+    def __init__(self, cache_dir, max_entries=embedding_cache_size):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.vectors = None
+
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+        # The capacity is fixed when the cache is created because it sizes the vector file
+        self.db.execute("INSERT OR IGNORE INTO settings VALUES ('capacity', ?)", (max_entries,))
+        self.capacity = self._setting("capacity")
+        self.dim = self._setting("dim")
+
+    def _setting(self, name):
+        row = self.db.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _open_vectors(self, dim):
+        if self.vectors is None:
+            mode = "r+" if os.path.exists(self.vectors_path) else "w+"
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+        return self.vectors
+
+    def _slots(self, keys):
+        # Look keys up in batches that stay under SQLite's bound-parameter limit
+        slots = {}
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            slots.update(self.db.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch).fetchall())
+        return slots
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def get_many(self, keys):
+        # Returns {key: vector} for the keys that are cached and marks them as recently used
+        if self.dim is None:
+            # Another process may have written the first vectors since this cache was opened
+            self.dim = self._setting("dim")
+        if not keys or self.dim is None:
+            self.misses += len(keys)
+            return {}
+        with self.lock:
+            # put_many in another process rewrites rows before it commits, so the rows are copied while
+            # holding the write lock; a plain read snapshot would not stop a slot being reused mid-copy
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._slots(list(dict.fromkeys(keys)))
+                if found:
+                    now = time.time_ns()
+                    self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                vectors = self._open_vectors(self.dim)
+                result = {key: np.array(vectors[slot]) for key, slot in found.items()}
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        hits = sum(1 for key in keys if key in result)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return result
+
+    def put_many(self, items):
+        # items is a list of (key, vector); the least recently used rows are reused once the cache is full
+        items = list(dict(items).items())[-self.capacity:]
+        if not items:
+            return
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self.dim = len(items[0][1])
+                    self.db.execute("INSERT OR IGNORE INTO settings VALUES ('dim', ?)", (self.dim,))
+                vectors = self._open_vectors(self.dim)
+
+                existing = self._slots([key for key, _ in items])
+                new_keys = [key for key, _ in items if key not in existing]
+
+                # Slots 0..count-1 are always in use, so free slots come from the end and then from eviction
+                count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                free_slots = list(range(count, min(count + len(new_keys), self.capacity)))
+                evict = len(new_keys) - len(free_slots)
+                if evict > 0:
+                    # Entries being rewritten are never evicted, so look past them
+                    least_recent = self.db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict + len(existing),)).fetchall()
+                    evicted = [(key, slot) for key, slot in least_recent if key not in existing][:evict]
+                    self.db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                    free_slots += [slot for _, slot in evicted]
+
+                slots = dict(existing)
+                slots.update(zip(new_keys, free_slots))
+                now = time.time_ns()
+                for key, vector in items:
+                    vectors[slots[key]] = np.asarray(vector, dtype=np.float32)
+                vectors.flush()
+                self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", [(key, slots[key], now) for key, _ in items])
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embeddings model so repeated chunks and queries are served from an EmbeddingCache."""
+
+    def __init__(self, embeddings, model=None, cache_dir=embedding_cache_dir, max_entries=embedding_cache_size):
+        self.embeddings = embeddings
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        self.cache = EmbeddingCache(os.path.join(cache_dir, self.model), max_entries)
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each missing text once, even if it appears several times in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            cached.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in new_items)
+        return [cached[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        key = self._key(text)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key].tolist()
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many([(key, vector)])
+        return list(vector)
@@ -0,0 +1,158 @@
+import os
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+import pdfplumber
+from stage_metrics import metrics
+
+# Worker processes import this module, so it must stay free of module-level work.
+
+# Number of extraction processes; 0 or unset means one per CPU core
+extraction_workers = int(os.getenv("extraction_workers", "0")) or os.cpu_count() or 1
+
+# Pages handed to a worker at a time, so each worker opens a PDF once per batch
+pages_per_task = 4
+
+
+def table_to_text(table):
+    # Clean up multi-line cells and use "-" as the column separator
+    cleaned_table = []
+    for row in table:
+        cleaned_row = [' '.join(cell.splitlines()) if cell else '' for cell in row]
+        cleaned_table.append(cleaned_row)
+    return "\n".join([" - ".join(row) for row in cleaned_table])
+
+
+def extract_column_pages(pdf_path, start, stop):
+    # Read each page of a two-column PDF as its left half followed by its right half
+    page_texts = []
+    with fitz.open(pdf_path) as doc:
+        for page_num in range(start, stop):
+            page = doc.load_page(page_num)
+            width, height = page.rect.width, page.rect.height
+
+            column1_rect = fitz.Rect(0, 0, width / 2, height)
+            column2_rect = fitz.Rect(width / 2, 0, width, height)
+            column1_text = page.get_text("text", clip=column1_rect)
+            column2_text = page.get_text("text", clip=column2_rect)
+
+            page_texts.append(column1_text + "\n" + column2_text + "\n")
+    return page_texts
+
+
+def extract_plumber_pages(pdf_path, start, stop):
+    # Page text followed by every table on the page, one string per page
+    page_texts = []
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text() or ""
+            for table in page.extract_tables():
+                page_text += "\n" + table_to_text(table) + "\n"
+            page_texts.append(page_text)
+    return page_texts
+
+
+def clean_table(table):
+    # Join multi-line cells, then drop empty rows and the empty columns left by merged cells
+    rows = [[' '.join(cell.splitlines()) if cell else '' for cell in row] for row in table]
+    rows = [row for row in rows if any(row)]
+    width = max((len(row) for row in rows), default=0)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    keep = [i for i in range(width) if any(row[i] for row in rows)]
+    return [[row[i] for i in keep] for row in rows]
+
+
+def _contains(outer, inner):
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+
+def _inside(obj, bbox):
+    x, y = (obj["x0"] + obj["x1"]) / 2, (obj["top"] + obj["bottom"]) / 2
+    return bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]
+
+
+def extract_plumber_page_tables(pdf_path, start, stop):
+    # Per page, the text outside the tables and the tables themselves as cleaned rows
+    pages = []
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            found = page.find_tables()
+            tables, bboxes = [], []
+            for table in found:
+                # Tables nested in another table are part of it
+                if any(other is not table and _contains(other.bbox, table.bbox) for other in found):
+                    continue
+                rows = clean_table(table.extract())
+                # A single column is a framed paragraph rather than a table, so it stays in the text
+                if rows and len(rows[0]) > 1:
+                    tables.append(rows)
+                    bboxes.append(table.bbox)
+            if bboxes:
+                page = page.filter(lambda obj: obj["object_type"] != "char" or not any(_inside(obj, bbox) for bbox in bboxes))
+            pages.append((page.extract_text() or "", tables))
+    return pages
+
+
+def page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def _timed_task(page_fn, pdf_path, start, stop):
+    # Runs in the worker; the time travels back with the pages so the parent can record it
+    task_start = time.perf_counter()
+    page_texts = page_fn(pdf_path, start, stop)
+    return time.perf_counter() - task_start, page_texts
+
+
+def _task_pages(pdf_index, start, result):
+    seconds, page_texts = result
+    metrics.record("extract_page", seconds, len(page_texts) or 1)
+    for page_number, page_text in enumerate(page_texts, start + 1):
+        yield pdf_index, page_number, page_text
+
+
+def iter_pdf_pages(pdf_paths, page_fn, max_workers=None):
+    """Run page_fn over every page of every PDF on a process pool, yielding pages as they are ready.
+
+    Yields (pdf_index, page_number, page_text) in the order of pdf_paths and pages, with
+    page numbers starting at 1. Only two batches per worker are in flight at a time, so a
+    slow consumer holds a handful of pages in memory rather than the whole corpus.
+    """
+    max_workers = max_workers or extraction_workers
+    tasks = []
+    for pdf_index, pdf_path in enumerate(pdf_paths):
+        num_pages = page_count(pdf_path)
+        for start in range(0, num_pages, pages_per_task):
+            tasks.append((pdf_index, pdf_path, start, min(start + pages_per_task, num_pages)))
+
+    # Never nest pools inside a worker, and skip the pool when it cannot help
+    in_worker = multiprocessing.parent_process() is not None
+    if max_workers <= 1 or len(tasks) <= 1 or in_worker:
+        for pdf_index, pdf_path, start, stop in tasks:
+            yield from _task_pages(pdf_index, start, _timed_task(page_fn, pdf_path, start, stop))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        pending = deque()
+        for pdf_index, pdf_path, start, stop in tasks:
+            if len(pending) >= 2 * max_workers:
+                pdf_index_done, start_done, future = pending.popleft()
+                yield from _task_pages(pdf_index_done, start_done, future.result())
+            pending.append((pdf_index, start, executor.submit(_timed_task, page_fn, pdf_path, start, stop)))
+        while pending:
+            pdf_index, start, future = pending.popleft()
+            yield from _task_pages(pdf_index, start, future.result())
+
+
+def extract_pdf_pages(pdf_paths, page_fn, max_workers=None):
+    """Run page_fn over every page of every PDF on a process pool.
+
+    Returns one list of page texts per PDF, in the order of pdf_paths and pages.
+    """
+    pages_per_pdf = [[] for _ in pdf_paths]
+    for pdf_index, _, page_text in iter_pdf_pages(pdf_paths, page_fn, max_workers):
+        pages_per_pdf[pdf_index].append(page_text)
+    return pages_per_pdf
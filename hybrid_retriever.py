@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Inverted index built by vectordb.py alongside the vector index
+sparse_index_path = os.getenv("sparse_index_path", "bm25_index.json")
+
+# Course numbers such as "EEE F214" or "CS F111", with or without the space
+_course_code = re.compile(r"\b([a-z]{2,5})\s*([a-z])\s*(\d{3})\b")
+_word = re.compile(r"[a-z0-9]+")
+
+# Student shorthand that never appears verbatim in the documents (keys are stemmed tokens)
+query_synonyms = {
+    "del": ["discipline", "elective"],
+    "cdc": ["discipline", "core"],
+}
+
+
+def _stem(word):
+    # Plural folding is enough for course listings ("electives", "dels", "cdcs")
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    # Lower-cased words plus one joined token per course number, so "EEE F214" matches as a unit
+    text = text.lower()
+    tokens = [_stem(word) for word in _word.findall(text)]
+    tokens += ["".join(parts) for parts in _course_code.findall(text)]
+    return tokens
+
+
+def tokenize_query(text):
+    tokens = tokenize(text)
+    for token in list(tokens):
+        tokens += query_synonyms.get(token, [])
+    return tokens
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class BM25Index:
+    """Okapi BM25 over labeled chunks, stored with its postings so loading does no tokenizing.
+
+    An index loaded from a file reloads itself on the next search after vectordb.py replaces
+    that file, like LocalVectorIndex, so a long-running chatbot never serves stale chunk text.
+    """
+
+    def __init__(self, docs=None, postings=None, lengths=None, k1=1.5, b=0.75, path=None, version=None):
+        self.docs = docs or {}
+        self.k1 = k1
+        self.b = b
+        self.path = path
+        self.loaded_version = version
+        self.lock = threading.Lock()
+        if postings is None:
+            self._build()
+        else:
+            self.labels = list(self.docs)
+            self.postings = postings
+            self.lengths = lengths
+
+    def _build(self):
+        self.labels = list(self.docs)
+        self.lengths = []
+        self.postings = defaultdict(list)
+        for doc_id, label in enumerate(self.labels):
+            counts = Counter(tokenize(self.docs[label]))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append([doc_id, tf])
+        self.postings = dict(self.postings)
+
+    @classmethod
+    def load(cls, path=sparse_index_path):
+        # The version is taken before reading, so a file replaced mid-read is picked up on the next check
+        version = _file_version(path)
+        if version is None:
+            return cls(path=path)
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(dict(zip(data["labels"], data["texts"])), data["postings"], data["lengths"], path=path, version=version)
+
+    def save(self, path=sparse_index_path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"labels": self.labels, "texts": [self.docs[label] for label in self.labels],
+                       "lengths": self.lengths, "postings": self.postings}, f)
+        os.replace(tmp_path, path)
+        if path == self.path:
+            self.loaded_version = _file_version(path)
+
+    def reload_if_changed(self):
+        # Pick up a rebuild written by another process (e.g. vectordb.py) since this index was loaded
+        if self.path is None or _file_version(self.path) == self.loaded_version:
+            return
+        fresh = BM25Index.load(self.path)
+        with self.lock:
+            self.docs, self.labels, self.postings, self.lengths = fresh.docs, fresh.labels, fresh.postings, fresh.lengths
+            self.loaded_version = fresh.loaded_version
+
+    def update(self, chunks, removed_labels=()):
+        # chunks is an iterable of (label, text); postings are rebuilt once for the whole change
+        for label in removed_labels:
+            self.docs.pop(label, None)
+        for label, text in chunks:
+            self.docs[label] = text
+        self._build()
+
+    def search(self, query, k=8):
+        """Return up to k (label, text, score) tuples, best first."""
+        self.reload_if_changed()
+        with self.lock:
+            docs, labels, all_postings, lengths = self.docs, self.labels, self.postings, self.lengths
+        if not labels:
+            return []
+        avg_length = sum(lengths) / len(lengths)
+        scores = defaultdict(float)
+        for term in set(tokenize_query(query)):
+            postings = all_postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(labels) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(labels[doc_id], docs[labels[doc_id]], score) for doc_id, score in best]
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses dense retriever results with BM25 results using reciprocal-rank fusion.
+
+    Exact tokens such as course numbers that dense similarity misses are recovered by BM25,
+    so a small k still covers them. Documents are matched across the two lists by their text.
+    """
+
+    dense_retriever: BaseRetriever
+    sparse_index: Any
+    k: int = 5
+    sparse_k: int = 8
+    rrf_k: int = 60
+
+    def _fuse(self, query, dense_docs):
+        scores, docs = defaultdict(float), {}
+        for rank, doc in enumerate(dense_docs):
+            docs.setdefault(doc.page_content, doc)
+            scores[doc.page_content] += 1.0 / (self.rrf_k + rank + 1)
+        for rank, (label, text, _) in enumerate(self.sparse_index.search(query, self.sparse_k)):
+            docs.setdefault(text, Document(page_content=text, metadata={"label": label}))
+            scores[text] += 1.0 / (self.rrf_k + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [docs[text] for text in best]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        dense_docs = self.dense_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(query, dense_docs)
+
+    async def _aget_relevant_documents(self, query, *, run_manager):
+        dense_docs = await self.dense_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self._fuse(query, dense_docs)
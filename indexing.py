@@ -0,0 +1,127 @@
+import os
+from langchain_core.documents import Document
+from preprocessing import iter_labeled_chunks, source_files
+from ingestion import IngestionEngine
+from local_index import LocalVectorIndex
+from hybrid_retriever import BM25Index, sparse_index_path
+from table_store import TableStore, table_store_path
+from dedup import NearDuplicateIndex, dedup_index_path
+from stage_metrics import metrics
+from manifest import (manifest_path, file_hash, load_manifest, save_manifest, changed_sources, update_manifest, track_chunks,
+                      diff_manifests, describes_index, chunk_hashes)
+
+# Chunk fields copied into each vector's metadata
+metadata_keys = ("label", "source", "page", "offset", "table", "row")
+
+
+def state_paths(state_dir=None):
+    # The manifest and the indexes kept next to the vectors; a state_dir keeps a separate set, e.g. for the benchmark
+    paths = {"manifest": manifest_path, "table_store": table_store_path, "dedup": dedup_index_path, "sparse": sparse_index_path}
+    if state_dir is not None:
+        paths = {name: os.path.join(state_dir, os.path.basename(path)) for name, path in paths.items()}
+    return paths
+
+
+def delete_embeddings(index, labels, batch_size=1000):
+    for i in range(0, len(labels), batch_size):
+        index.delete(ids=labels[i:i + batch_size])
+
+
+def index_dataset(embeddings, index, index_target, full=False, sources=None, max_workers=None, state_dir=None):
+    """Bring `index` and the manifest, table, dedup and BM25 files in line with the dataset.
+
+    Only new or changed files are extracted, and only chunks whose text changed are embedded.
+    `index` is a Pinecone index or a LocalVectorIndex, and `index_target` names it in the
+    manifest. `sources` restricts the run to some of the source files. Returns the counts
+    that vectordb.py prints.
+    """
+    paths = state_paths(state_dir)
+    previous_manifest = load_manifest(paths["manifest"])
+    local = isinstance(index, LocalVectorIndex)
+    # A manifest written for another backend or index directory, or a local index that has gone missing,
+    # says nothing about what this index holds, so everything is rebuilt
+    if not describes_index(previous_manifest, index_target) or (local and not len(index) and chunk_hashes(previous_manifest)):
+        if not full and previous_manifest["files"]:
+            print(f"The index manifest does not describe the {index_target['backend']} index at {index_target['location']}, rebuilding everything.")
+        full = True
+    manifest = {"generation": previous_manifest["generation"], "index": index_target, "files": {}} if full else previous_manifest
+    if sources is not None:
+        sources = {os.path.normpath(path) for path in sources}
+    sources = [(path, prefix) for path, prefix in source_files() if sources is None or os.path.normpath(path) in sources]
+    file_hashes = {path: file_hash(path) for path, _ in sources}
+    changed = changed_sources(manifest, sources, file_hashes)
+
+    # Chunks stream from page extraction through the splitter into batched, concurrent embedding
+    # and upsert calls, and the manifest is filled in as they pass.
+    new_manifest = update_manifest(manifest, sources, file_hashes, changed)
+    sparse_chunks = []
+    # Tables of re-extracted and removed files are replaced by the ones extracted in this run
+    table_store = TableStore() if full else TableStore.load(paths["table_store"])
+    table_store.remove_sources(changed | (table_store.sources() - set(file_hashes)))
+    # Near-duplicates of a chunk that already has a vector are recorded against it but never embedded
+    dedup_index = NearDuplicateIndex() if full else NearDuplicateIndex.load(paths["dedup"])
+    previous_duplicates = set(dedup_index.duplicates)
+    new_duplicates = set()
+
+    def add_to_dedup(chunk):
+        with metrics.stage("dedup"):
+            return dedup_index.add(chunk["label"], chunk["content"], chunk["source"])
+
+    def document(chunk):
+        sparse_chunks.append((chunk["label"], chunk["content"]))
+        return Document(page_content=chunk["content"], metadata={key: chunk[key] for key in metadata_keys if key in chunk})
+
+    def changed_documents(changed_paths):
+        labeled_chunks = iter_labeled_chunks(changed_paths, max_workers=max_workers, table_store=table_store) if changed_paths else []
+        for chunk in track_chunks(new_manifest, manifest, labeled_chunks):
+            if add_to_dedup(chunk) is not None:
+                new_duplicates.add(chunk["label"])
+                continue
+            yield document(chunk)
+
+    def orphaned_documents(labels):
+        # Only the orphaned chunks are re-read from their unchanged files, whose manifest entries and tables stay as they are
+        for chunk in iter_labeled_chunks({dedup_index.sources[label] for label in labels}, max_workers=max_workers):
+            if chunk["label"] in labels and add_to_dedup(chunk) is None:
+                yield document(chunk)
+
+    engine = IngestionEngine(embeddings, index)
+    stored = engine.run(changed_documents(changed))
+    # A full rebuild re-embeds every chunk but still deletes only what the last run stored
+    _, deleted_labels = diff_manifests(previous_manifest, new_manifest)
+    dedup_index.remove(deleted_labels)
+
+    # Duplicates of a chunk that changed or went away are checked again, and embedded if nothing else matches
+    rechecked, restored = set(), 0
+    while orphaned := dedup_index.take_orphans() - rechecked:
+        rechecked |= orphaned
+        restored += engine.run(orphaned_documents(orphaned))
+
+    # Chunks that became duplicates in this run lose their vector, and canonical vectors list the sources they stand for.
+    # Chunks that were already duplicates never had one.
+    duplicate_labels = sorted(label for label in new_duplicates if label in dedup_index.duplicates and label not in previous_duplicates)
+    if deleted_labels or duplicate_labels:
+        delete_embeddings(index, deleted_labels + duplicate_labels)
+    groups = dedup_index.groups()
+    for label in sorted(dedup_index.touched | {label for label, _ in sparse_chunks if label in groups}):
+        if label in dedup_index.signatures:
+            index.update(id=label, set_metadata=dedup_index.merged_metadata(label, groups))
+    if local:
+        with metrics.stage("index_save"):
+            index.save()
+
+    # Keep the BM25 inverted index in step with the vector index
+    with metrics.stage("bm25_build"):
+        sparse_index = BM25Index() if full else BM25Index.load(paths["sparse"])
+        sparse_index.update([chunk for chunk in sparse_chunks if chunk[0] not in dedup_index.duplicates], deleted_labels + duplicate_labels)
+        sparse_index.save(paths["sparse"])
+    table_store.save(paths["table_store"])
+    dedup_index.save(paths["dedup"])
+
+    if stored or restored or deleted_labels or duplicate_labels:
+        new_manifest["generation"] += 1
+    save_manifest(new_manifest, paths["manifest"])
+
+    return {"files_extracted": len(changed), "chunks_embedded": stored, "duplicates_embedded": restored,
+            "new_duplicates": len(duplicate_labels), "stale_deleted": len(deleted_labels),
+            "index_chunks": len(dedup_index), "index_duplicates": len(dedup_index.duplicates)}
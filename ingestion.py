@@ -0,0 +1,176 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from stage_metrics import metrics
+from tokens import count_tokens
+
+# Batching and concurrency limits for the ingestion engine
+embed_batch_tokens = int(os.getenv("embed_batch_tokens", "100000"))
+embed_batch_size = int(os.getenv("embed_batch_size", "256"))
+embed_concurrency = int(os.getenv("embed_concurrency", "4"))
+upsert_batch_size = int(os.getenv("upsert_batch_size", "100"))
+upsert_concurrency = int(os.getenv("upsert_concurrency", "4"))
+max_retries = int(os.getenv("ingestion_max_retries", "6"))
+
+
+def token_batches(documents, max_tokens=embed_batch_tokens, max_items=embed_batch_size):
+    # Group a stream of documents into batches under both a token and an item budget
+    batch, batch_tokens = [], 0
+    for doc in documents:
+        tokens = count_tokens(doc.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _status(error):
+    return getattr(error, "status_code", None) or getattr(error, "status", None)
+
+
+def is_rate_limit(error):
+    return _status(error) == 429 or "rate limit" in str(error).lower()
+
+
+def is_transient(error):
+    # Rate limits, timeouts, dropped connections and server errors are worth retrying; bad keys
+    # and invalid or oversized inputs fail the same way every time
+    status = _status(error)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)) or is_rate_limit(error):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def vector_record(doc, vector):
+    # Pinecone-style record: the label is the id and the chunk text travels in the metadata
+    metadata = {key: value for key, value in doc.metadata.items() if key != "label"}
+    metadata["text"] = doc.page_content
+    return {"id": doc.metadata["label"], "values": vector, "metadata": metadata}
+
+
+class AdaptiveLimit:
+    """Concurrency limit that halves on rate-limit errors and creeps back up on success."""
+
+    def __init__(self, limit):
+        self.max_limit = limit
+        self.limit = limit
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, rate_limited=False):
+        with self.condition:
+            self.active -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class IngestionEngine:
+    """Streams documents through batched, concurrent embedding and upsert calls.
+
+    `embeddings` needs `embed_documents` and `index` needs Pinecone's `upsert(vectors=...)`, so
+    local fakes can stand in for OpenAI and Pinecone. At most two batches per worker are in
+    flight at each stage, which bounds memory no matter how large the input stream is.
+    """
+
+    def __init__(self, embeddings, index, embed_concurrency=embed_concurrency, upsert_concurrency=upsert_concurrency,
+                 batch_tokens=embed_batch_tokens, batch_size=embed_batch_size, upsert_batch_size=upsert_batch_size,
+                 max_retries=max_retries, backoff=1.0):
+        self.embeddings = embeddings
+        self.index = index
+        self.embed_concurrency = embed_concurrency
+        self.upsert_concurrency = upsert_concurrency
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.embed_limit = AdaptiveLimit(embed_concurrency)
+        self.upsert_limit = AdaptiveLimit(upsert_concurrency)
+        self.stats = {"embedded": 0, "upserted": 0, "retries": 0, "rate_limited": 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def _call(self, limit, fn, *args, **kwargs):
+        # Retry transient errors with jittered exponential backoff; rate-limit errors also shrink the concurrency limit
+        for attempt in range(self.max_retries + 1):
+            limit.acquire()
+            rate_limited = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception as error:
+                rate_limited = is_rate_limit(error)
+                if attempt == self.max_retries or not is_transient(error):
+                    raise
+                self._count("retries")
+                if rate_limited:
+                    self._count("rate_limited")
+            finally:
+                limit.release(rate_limited)
+            time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def _embed(self, batch):
+        with metrics.stage("embed_batch"):
+            vectors = self._call(self.embed_limit, self.embeddings.embed_documents, [doc.page_content for doc in batch])
+        self._count("embedded", len(batch))
+        return [vector_record(doc, vector) for doc, vector in zip(batch, vectors)]
+
+    def _upsert(self, records):
+        with metrics.stage("upsert_batch"):
+            self._call(self.upsert_limit, self.index.upsert, vectors=records)
+        self._count("upserted", len(records))
+
+    @staticmethod
+    def _drain(futures, max_pending):
+        # Block until fewer than max_pending futures are running, re-raising any worker error
+        done_results = []
+        while len(futures) >= max_pending:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                done_results.append(future.result())
+        return done_results
+
+    def run(self, documents):
+        """Embed and upsert every document in the stream; returns the number of vectors stored by this call."""
+        upserted = self.stats["upserted"]
+        embed_futures, upsert_futures = set(), set()
+        with ThreadPoolExecutor(self.embed_concurrency) as embed_pool, ThreadPoolExecutor(self.upsert_concurrency) as upsert_pool:
+
+            def submit_upserts(embedded_batches):
+                for records in embedded_batches:
+                    for i in range(0, len(records), self.upsert_batch_size):
+                        self._drain(upsert_futures, 2 * self.upsert_concurrency)
+                        upsert_futures.add(upsert_pool.submit(self._upsert, records[i:i + self.upsert_batch_size]))
+
+            for batch in token_batches(documents, self.batch_tokens, self.batch_size):
+                submit_upserts(self._drain(embed_futures, 2 * self.embed_concurrency))
+                embed_futures.add(embed_pool.submit(self._embed, batch))
+            submit_upserts(self._drain(embed_futures, 1))
+            self._drain(upsert_futures, 1)
+        # stats keep counting across calls on the same engine
+        return self.stats["upserted"] - upserted
@@ -0,0 +1,335 @@
+import os
+import re
+import json
+import threading
+from collections import namedtuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Local alternative to Pinecone, chosen with vector_backend=local
+local_index_dir = os.getenv("local_index_dir", "local_index")
+local_index_mode = os.getenv("local_index_mode", "flat")
+
+# One loaded generation of the index; replaced as a whole, never modified, so a search reads one consistent set
+Generation = namedtuple("Generation", ["number", "ids", "metadata", "rows", "vectors", "ivf"])
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, k):
+    # Indices of the k highest scores, best first, without sorting the whole array
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _kmeans(vectors, nlist, iterations=10, seed=0):
+    # Spherical k-means on a sample of the (already normalized) vectors
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = sample[rng.integers(len(sample), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class LocalVectorIndex:
+    """On-disk vector index with the parts of Pinecone's index API that this project uses.
+
+    Vectors are normalized and kept as a float32 matrix in a memory-mapped file, so similarity
+    search is one matrix-vector product followed by a partial sort. In "ivf" mode vectors are also
+    clustered into inverted lists with int8-quantized copies; a search scores only the `nprobe`
+    closest lists from the quantized codes and re-ranks the best candidates exactly.
+
+    upsert appends normalized rows to a staging file and delete is staged in memory until save()
+    writes a new generation of files. records.json names the current generation and is replaced
+    last, atomically, so a process searching the index keeps its mapping of the previous files.
+    """
+
+    def __init__(self, index_dir=local_index_dir, mode=local_index_mode, nlist=None, nprobe=8, rerank_factor=4):
+        if mode not in ("flat", "ivf"):
+            raise ValueError(f"Unknown local index mode: {mode}")
+        self.index_dir = index_dir
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.records_path = os.path.join(index_dir, "records.json")
+        self.staging_path = os.path.join(index_dir, "staging.f32")
+        self.lock = threading.Lock()
+        # id -> (row in the staging file, or None to keep the stored vector, metadata)
+        self.pending = {}
+        self.deleted = set()
+        self.staging = None
+        self.staged_rows = 0
+        self.current = Generation(None, [], [], {}, None, None)
+        self.dim = None
+        self.loaded_version = None
+        self._load()
+
+    def _vectors_path(self, generation):
+        # Generation None is the layout written before generations were introduced
+        return os.path.join(self.index_dir, "vectors.f32" if generation is None else f"vectors_{generation}.f32")
+
+    def _ivf_path(self, name, generation):
+        return os.path.join(self.index_dir, f"ivf_{name}.npy" if generation is None else f"ivf_{generation}_{name}.npy")
+
+    def _records_version(self):
+        try:
+            stat = os.stat(self.records_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        for attempt in range(3):
+            try:
+                return self._load_generation()
+            except FileNotFoundError:
+                # A save replaced records.json and removed the generation it named while it was being read
+                if attempt == 2:
+                    raise
+
+    def _load_generation(self):
+        version = self._records_version()
+        records = {"ids": [], "metadata": [], "dim": 0}
+        if version is not None:
+            with open(self.records_path, "r") as f:
+                records = json.load(f)
+        generation, dim, vectors, ivf = records.get("generation"), records["dim"] or None, None, None
+        if records["ids"]:
+            vectors = np.memmap(self._vectors_path(generation), dtype=np.float32, mode="r", shape=(len(records["ids"]), dim))
+            if self.mode == "ivf":
+                ivf = self._load_ivf(vectors, generation)
+        # A single reference swap, so a search running on another thread sees one generation or the other
+        rows = {id: row for row, id in enumerate(records["ids"])}
+        self.current = Generation(generation, records["ids"], records["metadata"], rows, vectors, ivf)
+        self.dim, self.loaded_version = dim, version
+
+    def _load_ivf(self, vectors, generation):
+        try:
+            ivf = {name: np.load(self._ivf_path(name, generation), mmap_mode="r") for name in ("centroids", "order", "offsets", "codes", "scales")}
+        except FileNotFoundError:
+            ivf = None
+        if ivf is None or len(ivf["order"]) != len(vectors):
+            # Saved in flat mode or by an older build, so cluster now
+            self._build_ivf(vectors, generation)
+            return self._load_ivf(vectors, generation)
+        return ivf
+
+    def _build_ivf(self, vectors, generation):
+        nlist = self.nlist or max(1, int(np.sqrt(len(vectors))))
+        centroids = _kmeans(vectors, min(nlist, len(vectors)))
+        assignments = np.concatenate([np.argmax(vectors[i:i + 4096] @ centroids.T, axis=1) for i in range(0, len(vectors), 4096)])
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+
+        # Symmetric int8 quantization with one scale per vector
+        sorted_vectors = np.asarray(vectors[order])
+        scales = np.abs(sorted_vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(sorted_vectors / scales[:, None]).astype(np.int8)
+
+        # Each file is written aside and renamed into place, so a reader never maps a partial file
+        for name, array in (("centroids", centroids), ("order", order), ("offsets", offsets), ("codes", codes), ("scales", scales.astype(np.float32))):
+            path = self._ivf_path(name, generation)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+
+    def reload_if_changed(self):
+        # Pick up a rebuild written by another process (e.g. vectordb.py) since this index was loaded
+        if self._records_version() != self.loaded_version:
+            with self.lock:
+                self._load()
+
+    def upsert(self, vectors):
+        vectors = list(vectors)
+        if not vectors:
+            return
+        rows = _normalize(np.asarray([record["values"] for record in vectors], dtype=np.float32))
+        with self.lock:
+            if self.staging is None:
+                os.makedirs(self.index_dir, exist_ok=True)
+                self.staging = open(self.staging_path, "wb")
+                self.staged_rows = 0
+            self.staging.write(rows.tobytes())
+            for offset, record in enumerate(vectors):
+                self.pending[record["id"]] = (self.staged_rows + offset, record.get("metadata", {}))
+                self.deleted.discard(record["id"])
+            self.staged_rows += len(rows)
+            self.dim = rows.shape[1]
+
+    def delete(self, ids):
+        with self.lock:
+            for id in ids:
+                self.pending.pop(id, None)
+                self.deleted.add(id)
+
+    def update(self, id, set_metadata):
+        # Merge metadata into an existing vector, like Pinecone's update(id=..., set_metadata=...)
+        with self.lock:
+            current = self.current
+            if id in self.pending:
+                self.pending[id][1].update(set_metadata)
+            elif id in current.rows:
+                self.pending[id] = (None, {**current.metadata[current.rows[id]], **set_metadata})
+
+    def save(self):
+        """Write the staged upserts and deletes as a new generation and switch readers to it."""
+        with self.lock:
+            current = self.current
+            keep = [row for row, id in enumerate(current.ids) if id not in self.pending and id not in self.deleted]
+            ids = [current.ids[row] for row in keep] + list(self.pending)
+            metadata = [current.metadata[row] for row in keep] + [meta for _, meta in self.pending.values()]
+
+            staged = None
+            if self.staging is not None:
+                self.staging.close()
+                self.staging = None
+                if self.staged_rows:
+                    staged = np.memmap(self.staging_path, dtype=np.float32, mode="r", shape=(self.staged_rows, self.dim))
+
+            # Rows are copied block by block from the current generation and the staging file;
+            # metadata-only updates keep the vector they already had
+            generation = (current.number or 0) + 1
+            os.makedirs(self.index_dir, exist_ok=True)
+            vectors_path = self._vectors_path(generation)
+            pending = list(self.pending.items())
+            with open(vectors_path, "wb") as f:
+                for start in range(0, len(keep), 4096):
+                    f.write(np.ascontiguousarray(current.vectors[keep[start:start + 4096]], dtype=np.float32).tobytes())
+                for start in range(0, len(pending), 4096):
+                    block = pending[start:start + 4096]
+                    rows = np.empty((len(block), self.dim), dtype=np.float32)
+                    for position, (id, (row, _)) in enumerate(block):
+                        rows[position] = staged[row] if row is not None else current.vectors[current.rows[id]]
+                    f.write(rows.tobytes())
+            del staged
+
+            if self.mode == "ivf" and ids:
+                self._build_ivf(np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(len(ids), self.dim)), generation)
+            tmp_path = self.records_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"generation": generation, "dim": int(self.dim or 0), "ids": ids, "metadata": metadata}, f)
+            os.replace(tmp_path, self.records_path)
+
+            self.pending.clear()
+            self.deleted.clear()
+            if os.path.exists(self.staging_path):
+                os.remove(self.staging_path)
+            self._load()
+            self._remove_old_generations(generation)
+
+    def _remove_old_generations(self, generation):
+        # The previous generation stays for readers that are loading it right now; older ones go.
+        # Processes that still map a removed file keep reading it until they reload.
+        for name in os.listdir(self.index_dir):
+            match = re.fullmatch(r"(?:vectors_(\d+)\.f32|ivf_(\d+)_\w+\.npy|vectors\.f32|ivf_[a-z]+\.npy)", name)
+            if match is None:
+                continue
+            old = int(match.group(1) or match.group(2) or 0)
+            if old < generation - 1:
+                try:
+                    os.remove(os.path.join(self.index_dir, name))
+                except OSError:
+                    # Still mapped on Windows; the next save tries again
+                    pass
+
+    def query(self, vector, top_k=8):
+        """Return (id, score, metadata) for the top_k most similar stored vectors."""
+        self.reload_if_changed()
+        current = self.current
+        if current.vectors is None:
+            return []
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if current.ivf is None:
+            all_scores = current.vectors @ query
+            rows = _top_k(all_scores, top_k)
+            scores = all_scores[rows]
+        else:
+            rows, scores = self._query_ivf(current.vectors, current.ivf, query, top_k)
+        return [(current.ids[row], float(score), current.metadata[row]) for row, score in zip(rows, scores)]
+
+    def _query_ivf(self, vectors, ivf, query, top_k):
+        lists = _top_k(ivf["centroids"] @ query, self.nprobe)
+        positions = np.concatenate([np.arange(ivf["offsets"][c], ivf["offsets"][c + 1]) for c in lists])
+
+        # Approximate scores from the int8 codes, then exact scores for the best candidates
+        approx = (ivf["codes"][positions].astype(np.float32) @ query) * ivf["scales"][positions]
+        candidates = np.asarray(ivf["order"][positions[_top_k(approx, top_k * self.rerank_factor)]])
+        exact = vectors[candidates] @ query
+        best = _top_k(exact, top_k)
+        return candidates[best], exact[best]
+
+    def __len__(self):
+        return len(self.current.ids)
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain vector store over a LocalVectorIndex; stores chunk text under "text" like PineconeVectorStore."""
+
+    def __init__(self, index, embedding, text_key="text"):
+        self.index = index
+        self.embedding = embedding
+        self.text_key = text_key
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(i + len(self.index)) for i in range(len(texts))]
+        vectors = self.embedding.embed_documents(texts)
+        self.index.upsert(vectors=[
+            {"id": id, "values": vector, "metadata": {**metadata, self.text_key: text}}
+            for id, vector, metadata, text in zip(ids, vectors, metadatas, texts)
+        ])
+        self.index.save()
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        self.index.delete(ids=ids or [])
+        self.index.save()
+        return True
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, index_dir=local_index_dir, mode=local_index_mode, **kwargs):
+        store = cls(LocalVectorIndex(index_dir, mode=mode), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        results = []
+        for id, score, metadata in self.index.query(embedding, top_k=k):
+            metadata = dict(metadata)
+            text = metadata.pop(self.text_key, "")
+            results.append((Document(id=id, page_content=text, metadata=metadata), score))
+        return results
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+
+# Records what is already in the vector index so unchanged files are never re-extracted or re-embedded
+manifest_path = os.getenv("index_manifest", "index_manifest.json")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path=manifest_path):
+    if not os.path.exists(path):
+        return {"generation": 0, "files": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=manifest_path):
+    # Write to a temporary file first so an interrupted run never leaves a half-written manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def describes_index(manifest, index_target):
+    # The manifest, and the BM25, dedup and table files written with it, only hold for the index they were built
+    # against; a different backend or index location must be rebuilt from scratch
+    return manifest.get("index") == index_target
+
+
+# path -> (st_mtime_ns, generation) of the manifest file last read by manifest_version
+_versions = {}
+
+
+def manifest_version(path=manifest_path):
+    # The manifest's generation, which vectordb.py only bumps when vectors were added or removed; a run that
+    # changed nothing rewrites the file but keeps it. The file is only parsed again after it was rewritten.
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _versions.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _versions[path] = (mtime, load_manifest(path)["generation"])
+    return cached[1]
+
+
+def changed_sources(manifest, sources, file_hashes):
+    # A file must be re-extracted if its content changed or its chunks moved to a different label prefix
+    changed = set()
+    for path, label_prefix in sources:
+        entry = manifest["files"].get(path)
+        if entry is None or entry["sha256"] != file_hashes[path] or entry["label_prefix"] != label_prefix:
+            changed.add(path)
+    return changed
+
+
+def update_manifest(manifest, sources, file_hashes, changed, labeled_chunks=()):
+    # Unchanged files keep their entries; changed files are rebuilt from the freshly extracted chunks
+    files = {}
+    for path, label_prefix in sources:
+        if path in changed:
+            files[path] = {"sha256": file_hashes[path], "label_prefix": label_prefix, "chunks": {}}
+        else:
+            files[path] = manifest["files"][path]
+    for chunk in labeled_chunks:
+        files[chunk["source"]]["chunks"][chunk["label"]] = text_hash(chunk["content"])
+    return {"generation": manifest["generation"], "index": manifest.get("index"), "files": files}
+
+
+def track_chunks(new_manifest, old_manifest, labeled_chunks):
+    # Record each chunk in new_manifest as it streams past and pass on only those whose text is new or changed
+    old_chunks = chunk_hashes(old_manifest)
+    for chunk in labeled_chunks:
+        digest = text_hash(chunk["content"])
+        new_manifest["files"][chunk["source"]]["chunks"][chunk["label"]] = digest
+        if old_chunks.get(chunk["label"]) != digest:
+            yield chunk
+
+
+def chunk_hashes(manifest):
+    return {label: digest for entry in manifest["files"].values() for label, digest in entry["chunks"].items()}
+
+
+def diff_manifests(old_manifest, new_manifest):
+    """Compare two manifests chunk by chunk.
+
+    Returns the labels whose text is new or changed, and the labels that no longer exist.
+    """
+    old_chunks = chunk_hashes(old_manifest)
+    new_chunks = chunk_hashes(new_manifest)
+    changed_labels = {label for label, digest in new_chunks.items() if old_chunks.get(label) != digest}
+    deleted_labels = sorted(set(old_chunks) - set(new_chunks))
+    return changed_labels, deleted_labels
@@ -1,129 +1,99 @@
 import os
 import glob
 import json
-import fitz
-import pdfplumber
+import bisect
+import argparse
+import functools
+import itertools
+from operator import itemgetter
 import pymupdf
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from extraction import extract_pdf_pages, iter_pdf_pages, extract_column_pages, extract_plumber_pages, extract_plumber_page_tables
+from table_store import Table
+
+# Importing this module does no work; extraction only happens through the functions below or the CLI
 
 pdf_bulletin_paths = [
-    r"dataset\\campus_facilities.pdf",
-    r"dataset\\course_description.pdf",
-    r"dataset\\holidays.pdf",
+    os.path.join("dataset", "campus_facilities.pdf"),
+    os.path.join("dataset", "course_description.pdf"),
+    os.path.join("dataset", "holidays.pdf"),
 ]
 
-def extract_text_from_columns(pdf_bulletin_paths):
-    all_extracted_texts = []
-    
-    # Loop over each PDF bulletin file path
-    for pdf_bulletin_path in pdf_bulletin_paths:
-        doc = fitz.open(pdf_bulletin_path)
-        extracted_text = ""
-    
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
-            width, height = page.rect.width, page.rect.height
-            
-            column1_rect = fitz.Rect(0, 0, width / 2, height)
-            column2_rect = fitz.Rect(width / 2, 0, width, height)
-            column1_text = page.get_text("text", clip=column1_rect)
-            column2_text = page.get_text("text", clip=column2_rect)
-            
-            extracted_text += column1_text + "\n" + column2_text + "\n"
-        all_extracted_texts.append(extracted_text)
-    return all_extracted_texts
+# Extracted pages per (extractor, path), so each file is parsed at most once per run
+_extracted_pages = {}
+
+def extract_texts(paths, page_fn, max_workers=None):
+    # Extract the files that have not been parsed yet in one parallel pass, then serve all from the memo
+    missing = [path for path in dict.fromkeys(paths) if (page_fn.__name__, path) not in _extracted_pages]
+    if missing:
+        for path, page_texts in zip(missing, extract_pdf_pages(missing, page_fn, max_workers)):
+            _extracted_pages[(page_fn.__name__, path)] = page_texts
+    return ["".join(_extracted_pages[(page_fn.__name__, path)]) for path in paths]
+
+def iter_pages(paths, page_fn, max_workers=None):
+    # Stream (path, page_number, page_text) in order; memoized files are reused, streamed pages are not kept
+    key = page_fn.__name__
+    for memoized, group in itertools.groupby(paths, lambda path: (key, path) in _extracted_pages):
+        group = list(group)
+        if memoized:
+            for path in group:
+                for page_number, page_text in enumerate(_extracted_pages[(key, path)], 1):
+                    yield path, page_number, page_text
+        else:
+            for pdf_index, page_number, page_text in iter_pdf_pages(group, page_fn, max_workers):
+                yield group[pdf_index], page_number, page_text
+
+def extract_text_from_columns(pdf_bulletin_paths, max_workers=None):
+    # Pages are extracted in parallel and joined back in page order
+    return extract_texts(pdf_bulletin_paths, extract_column_pages, max_workers)
 
 
 #print(extract_text_from_columns(pdf_bulletin_paths))
 
 pdf_paths  = [
     
-    "dataset\\list_of_courses.pdf",
-    "dataset\\SU_constitution.pdf",
-    "dataset\\details_of_programmes.pdf",
-    "dataset\\WITW24.pdf",
-    "dataset\\BITS_contacts.pdf",
+    os.path.join("dataset", "list_of_courses.pdf"),
+    os.path.join("dataset", "SU_constitution.pdf"),
+    os.path.join("dataset", "details_of_programmes.pdf"),
+    os.path.join("dataset", "WITW24.pdf"),
+    os.path.join("dataset", "BITS_contacts.pdf"),
 ]
 
 
 
-def extract_content_pdfplumber(pdf_paths):
-    all_content = []
-    
-    # Loop over each PDF file
-    for pdf_path in pdf_paths:
-        combined_data = ""  
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                combined_data += page_text
-                
-                tables_on_page = page.extract_tables()
-                for table in tables_on_page:
-                    cleaned_table = []
-                    for row in table:
-                        cleaned_row = [' '.join(cell.splitlines()) if cell else '' for cell in row]
-                        cleaned_table.append(cleaned_row)
-                    
-                    table_str = "\n".join([" - ".join(row) for row in cleaned_table])#convert the cleaned table to string with - as column separator
-                    combined_data += "\n" + table_str + "\n"
-        
-        all_content.append(combined_data)
-    
-    return all_content
+def extract_content_pdfplumber(pdf_paths, max_workers=None):
+    # Each page contributes its text followed by its tables
+    return extract_texts(pdf_paths, extract_plumber_pages, max_workers)
 
 #print(extract_content_pdfplumber(pdf_paths))
 
-handouts_folder_path = "dataset//handouts"
-handouts_pdfs = glob.glob(os.path.join(handouts_folder_path, "*.pdf"))
+handouts_folder_path = os.path.join("dataset", "handouts")
+
+@functools.lru_cache(maxsize=None)
+def list_handouts():
+    # Sorted so handout labels stay stable between runs
+    return sorted(glob.glob(os.path.join(handouts_folder_path, "*.pdf")))
 
 
 def chunk_text_bypass(data_list):
     # Instead of chunking, return the content as-is, wrapped in a single "chunk"
     return [{"page_content": data} for data in data_list]
 
-def extract_content_handouts(handout_pdfs, bypass_chunking=True):
-    all_content = []
-    
-    # Loop over each PDF file
-    for pdf_path in handout_pdfs:
-        combined_data = ""  # For each file, initialize a string to hold combined data
-        
-        # Open the PDF with pdfplumber
-        with pdfplumber.open(pdf_path) as pdf:
-            # Loop through all pages in the PDF
-            for page in pdf.pages:
-                # Extract text
-                page_text = page.extract_text() or ""
-                combined_data += page_text
-                
-                # Extract tables and clean up multi-line cells
-                tables_on_page = page.extract_tables()
-                for table in tables_on_page:
-                    cleaned_table = []
-                    for row in table:
-                        cleaned_row = [' '.join(cell.splitlines()) if cell else '' for cell in row]
-                        cleaned_table.append(cleaned_row)
-                    # Convert the cleaned table to string with "-" as column separator
-                    table_str = "\n".join([" - ".join(row) for row in cleaned_table])
-                    combined_data += "\n" + table_str + "\n"
-        
-        # Append the entire combined content for each PDF to all_content list
-        all_content.append(combined_data)
+def extract_content_handouts(handout_pdfs, bypass_chunking=True, max_workers=None):
+    # Extract every handout page in parallel, then combine the pages of each PDF
+    all_content = extract_texts(handout_pdfs, extract_plumber_pages, max_workers)
     
     # Apply the bypass chunking function if bypass_chunking is True
     if bypass_chunking:
         return chunk_text_bypass(all_content)
 
-result = extract_content_handouts(handouts_pdfs)
-#print(result)
-
+timetable_path = os.path.join("dataset", "timetable.json")
 
-
-timetable_path = r"dataset\\timetable.json"
-with open(timetable_path, 'r') as f:
-    timetable_data = json.load(f)
+@functools.lru_cache(maxsize=None)
+def load_timetable():
+    with open(timetable_path, 'r') as f:
+        return json.load(f)
 
 def process_course_data(course_data):
     chunks = []
@@ -156,39 +126,154 @@ def process_course_data(course_data):
     return chunks
 
 
-# Process the timetable data into text chunks
-all_text_chunks = process_course_data(timetable_data["courses"])
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=300, length_function=len)
 
+# Characters of page text buffered before the splitter runs; only the buffer is ever split, never a whole document
+split_buffer_size = 16000
 
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=300, length_function=len)
+def split_pages(pages, label_prefix, source, splitter=text_splitter, buffer_size=split_buffer_size):
+    """Split one document, given as (page_number, page_text) pairs, into labeled chunks.
+
+    Pages are appended to a buffer that is split once it holds `buffer_size` characters. All
+    chunks but the last are emitted and the buffer restarts where the last chunk starts, so
+    chunks keep their overlap across buffer boundaries. Each chunk records the page it starts
+    on and its character offset in the document.
+    """
+    buffer, buffer_start = "", 0
+    page_starts, page_numbers = [], []
+    index = 0
+    for page_number, page_text in itertools.chain(pages, [(None, None)]):
+        final = page_text is None
+        if not final:
+            page_starts.append(buffer_start + len(buffer))
+            page_numbers.append(page_number)
+            buffer += page_text
+            if len(buffer) < buffer_size:
+                continue
+
+        chunks = splitter.split_text(buffer)
+        search_from = 0
+        for chunk in (chunks if final else chunks[:-1]):
+            offset = buffer_start + buffer.find(chunk, search_from)
+            labeled_chunk = {"label": f"{label_prefix}chunk_{index}", "content": chunk, "source": source, "offset": offset}
+            page = page_numbers[bisect.bisect_right(page_starts, offset) - 1]
+            if page is not None:
+                labeled_chunk["page"] = page
+            yield labeled_chunk
+            search_from = offset - buffer_start + 1
+            index += 1
+        if final:
+            return
+
+        # Keep only the text from the start of the last chunk onwards, and the pages it spans
+        tail = buffer.find(chunks[-1], search_from) if chunks else len(buffer)
+        buffer, buffer_start = buffer[tail:], buffer_start + tail
+        while len(page_starts) > 1 and page_starts[1] <= buffer_start:
+            page_starts.pop(0)
+            page_numbers.pop(0)
+
+def source_files():
+    # Every input file paired with the label prefix its chunks are stored under
+    sources = [(path, f"bulletin_{i}_") for i, path in enumerate(pdf_bulletin_paths)]
+    sources += [(path, f"pdf_content_{i}_") for i, path in enumerate(pdf_paths)]
+    sources += [(path, f"handout_{i}") for i, path in enumerate(list_handouts())]
+    sources.append((timetable_path, "course_"))
+    return sources
+
+def collect_tables(pages, source, tables):
+    """Pass on (page_number, text) for (page_number, (text, page_tables)) pages, gathering their tables.
+
+    A table that opens a page and has as many columns as the table closing the previous page
+    continues it, with a repeated header row dropped, so each logical table is one Table.
+    """
+    last_page = None
+    for page_number, (text, page_tables) in pages:
+        for position, rows in enumerate(page_tables):
+            previous = tables[-1] if tables else None
+            if position == 0 and previous is not None and last_page == page_number - 1 and len(rows[0]) == len(previous.header):
+                previous.extend(rows[1:] if rows[0] == previous.header else rows)
+            else:
+                tables.append(Table.from_rows(source, page_number, len(tables), rows[0], rows[1:]))
+            last_page = page_number
+        yield page_number, text
+
+def table_chunks(tables, label_prefix, table_store=None):
+    # One chunk per table, or per row group of a long table, each repeating the header
+    for table in tables:
+        if table_store is not None:
+            table_store.add(table)
+        for group, (first_row, text) in enumerate(table.chunks()):
+            yield {"label": f"{label_prefix}table_{table.index}_chunk_{group}", "content": text, "source": table.source,
+                   "page": table.page, "table": table.index, "row": first_row}
+
+def iter_labeled_chunks(sources=None, max_workers=None, table_store=None):
+    """Stream the labeled chunks of every file in `sources` (all of them when None).
+
+    Each chunk is a dict with its label, content, source file, the page it starts on and its
+    character offset in the document. Documents are split from page-level buffers as their
+    pages arrive, so memory holds a few pages at a time rather than the whole corpus. Labels
+    keep their full-corpus index.
+
+    Tables in the pdfplumber documents and handouts are kept out of the text and become chunks
+    of their own (see `table_chunks`); they are also added to `table_store` when one is given.
+    """
+    if sources is not None:
+        sources = {os.path.normpath(path) for path in sources}
+
+    def selected(paths):
+        return [(i, path) for i, path in enumerate(paths) if sources is None or os.path.normpath(path) in sources]
+
+    def documents(indexed_paths, page_fn, label_prefix):
+        # (path, label prefix, (page_number, page) pairs) for each selected document as its pages arrive
+        prefixes = {path: label_prefix.format(i) for i, path in indexed_paths}
+        page_stream = iter_pages([path for _, path in indexed_paths], page_fn, max_workers)
+        for path, pages in itertools.groupby(page_stream, itemgetter(0)):
+            yield path, prefixes[path], ((page_number, page) for _, page_number, page in pages)
+
+    for path, label_prefix, pages in documents(selected(pdf_bulletin_paths), extract_column_pages, "bulletin_{}_"):
+        yield from split_pages(pages, label_prefix, path)
+
+    # Process and split content from PDF paths, with tables chunked on their own
+    for path, label_prefix, pages in documents(selected(pdf_paths), extract_plumber_page_tables, "pdf_content_{}_"):
+        tables = []
+        yield from split_pages(collect_tables(pages, path, tables), label_prefix, path)
+        yield from table_chunks(tables, label_prefix, table_store)
+
+    # Handouts are kept whole without splitting, so each one is joined from its pages once
+    for path, label, pages in documents(selected(list_handouts()), extract_plumber_page_tables, "handout_{}"):
+        tables = []
+        content = "".join(page_text for _, page_text in collect_tables(pages, path, tables))
+        yield {"label": label, "content": content, "source": path, "offset": 0, "page": 1}
+        yield from table_chunks(tables, f"{label}_", table_store)
 
-def create_documents_with_labels():
-    all_text_chunks = []
-    bulletin_texts = extract_text_from_columns(pdf_bulletin_paths)
-    for i, text in enumerate(bulletin_texts):
-        # Split the text into chunks
-        split_text_chunks = text_splitter.split_text(text)
-        # Label each chunk and add to the list
-        all_text_chunks += [{"label": f"bulletin_{i}_chunk_{j}", "content": chunk} for j, chunk in enumerate(split_text_chunks)]
-    
-    # Process and split content from PDF paths
-    content_pdf = extract_content_pdfplumber(pdf_paths)
-    for i, text in enumerate(content_pdf):
-        split_text_chunks = text_splitter.split_text(text)
-        all_text_chunks += [{"label": f"pdf_content_{i}_chunk_{j}", "content": chunk} for j, chunk in enumerate(split_text_chunks)]
-    
-    # Process handouts content without splitting
-    content_handouts = extract_content_handouts(handouts_pdfs, bypass_chunking=True)
-    all_text_chunks += [{"label": f"handout_{i}", "content": text["page_content"]} for i, text in enumerate(content_handouts)]
-    
     # Process and split course data chunks
-    course_data_chunks = process_course_data(timetable_data["courses"])
-    for i, text in enumerate(course_data_chunks):
-        split_text_chunks = text_splitter.split_text(text)
-        all_text_chunks += [{"label": f"course_{i}_chunk_{j}", "content": chunk} for j, chunk in enumerate(split_text_chunks)]
-    
-    return all_text_chunks
+    if sources is None or os.path.normpath(timetable_path) in sources:
+        for i, text in enumerate(process_course_data(load_timetable()["courses"])):
+            yield from split_pages([(None, text)], f"course_{i}_", timetable_path)
+
+def create_documents_with_labels(sources=None, max_workers=None):
+    # Only files in `sources` are extracted (all of them when None); labels keep their full-corpus index
+    return list(iter_labeled_chunks(sources, max_workers))
 
 
 #print(all_text_chunks)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and chunk the dataset without touching the vector index.")
+    parser.add_argument("sources", nargs="*", help="only process these files (default: every source file)")
+    parser.add_argument("--workers", type=int, help="extraction processes (default: one per CPU core)")
+    parser.add_argument("--output", help="write the labeled chunks to this file, one JSON object per line")
+    args = parser.parse_args()
+
+    output = open(args.output, "w") if args.output else None
+    chunks_per_source = {}
+    for chunk in iter_labeled_chunks(args.sources or None, max_workers=args.workers):
+        chunks_per_source[chunk["source"]] = chunks_per_source.get(chunk["source"], 0) + 1
+        if output:
+            output.write(json.dumps(chunk) + "\n")
+    if output:
+        output.close()
+    for path, count in chunks_per_source.items():
+        print(f"{path}: {count} chunks")
+    print(f"{sum(chunks_per_source.values())} chunks in total")
+
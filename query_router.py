@@ -0,0 +1,72 @@
+import re
+
+# Course numbers such as "EEE F214" or "CS F111", with or without the space
+_course_code = re.compile(r"\b([a-z]{2,5})\s*([a-z])\s*(\d{3})\b")
+_word = re.compile(r"[a-z0-9']+")
+
+# Words that only make sense with the previous turns in view
+referring_words = {"it", "its", "it's", "that", "this", "these", "those", "they", "them", "their", "he", "she", "him",
+                   "her", "his", "same", "above", "previous", "former", "latter", "one", "ones", "else", "other", "another",
+                   "also", "too", "again", "more", "further", "yes", "yeah", "sure", "ok", "okay", "no", "nope"}
+# "the course" in a follow-up means the course from the previous turns
+referring_phrases = ("the course", "the subject", "the handout", "the professor", "the instructor", "the section",
+                     "the class", "the exam", "the book", "the minor", "the program")
+# Openings that continue the previous question ("and L2?", "what about CS F111?")
+continuations = ("and ", "or ", "but ", "also ", "what about", "how about", "then ", "so ")
+filler_words = {"what", "which", "who", "when", "where", "how", "is", "are", "the", "a", "an", "of", "for", "in", "on",
+                "to", "do", "does", "me", "i", "can", "you", "please", "tell", "give", "list", "show", "about"}
+
+# Signs that a question needs gpt-4o rather than gpt-4o-mini; an explicit comparison is enough on its own,
+# the open-ended words only count as one signal because they also show up in plain lookups ("who should I contact")
+comparison_words = {"compare", "comparison", "difference", "differences", "differ", "versus", "vs"}
+open_ended_words = {"common", "between", "both", "either", "overlap", "better", "best", "recommend", "suggest", "should",
+                    "plan", "why", "explain"}
+exhaustive_phrases = ("list all", "all the", "all courses", "every course", "each course", "complete list", "full list")
+complex_question_words = 30
+
+
+def _words(question):
+    return _word.findall(question.lower())
+
+
+def course_codes(question):
+    return {"".join(parts) for parts in _course_code.findall(question.lower())}
+
+
+def needs_reformulation(question, chat_history):
+    """Whether a question has to be rewritten with the chat history before it can be answered on its own.
+
+    The first turn never does. A follow-up does if it refers back to the conversation, opens
+    like a continuation, or is too short to say what it is about.
+    """
+    if not chat_history:
+        return False
+    text = question.lower().strip()
+    words = _words(text)
+    if not words or text.startswith(continuations) or set(words) & referring_words:
+        return True
+    if any(phrase in text for phrase in referring_phrases):
+        return True
+    content_words = [word for word in words if word not in filler_words]
+    return len(content_words) < 3 and not course_codes(text)
+
+
+def is_complex(question):
+    """Whether a question is a comparative or multi-part one that warrants the larger model.
+
+    Explicit comparisons always are; otherwise two of: a recommendation or explanation word, several
+    questions, several course numbers, an exhaustive listing, a long question, many joined requests.
+    """
+    text = question.lower()
+    words = _words(text)
+    if set(words) & comparison_words:
+        return True
+    signals = 0
+    signals += bool(set(words) & open_ended_words)
+    signals += text.count("?") > 1
+    signals += len(course_codes(text)) > 1
+    signals += any(phrase in text for phrase in exhaustive_phrases)
+    signals += len(words) > complex_question_words
+    # Several independent requests joined into one ("... and also ...; ...")
+    signals += text.count(" and ") + text.count(";") > 2
+    return signals >= 2 or len(words) > 2 * complex_question_words
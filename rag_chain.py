@@ -0,0 +1,259 @@
+import time
+from operator import itemgetter
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.retrievers import ContextualCompressionRetriever
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough
+from langchain_core.runnables.history import RunnableWithMessageHistory
+from hybrid_retriever import HybridRetriever
+from context_packer import ContextPacker
+from query_router import needs_reformulation, is_complex
+from answer_cache import cache_answers
+from stage_metrics import metrics
+
+# Prompts and chain assembly, free of API clients so the same chain can be built on any backend
+
+# System prompt for guiding the responses
+system_prompt = (
+    "You are an assistant chatbot designed to help a student who is seeking academic guidance. "
+    "Remember that the symbol 'U' in the database represents the units of the course. "
+    "You are provided with a dataset stored in a variable called vector_store, which contains all the course details and programs offered at a university. "
+    
+    "When the student asks about specific courses, provide precise and detailed information, including the course name, number of credits (denoted as 'U' for units). Only give the courses that are provided in the database, minor programs, and give the description mentioned only in the database. "
+    
+    "Identify and list all the minor programs offered by the college when relevant to the student's query. Also, mention all the core courses of that minor program asked and the electives to be done in that minor program. "
+    
+    "When the user asks about any course, minor, or college-related procedures, only give the context that is available in the dataset without generating any additional text. "
+    
+    "If the student's query is related to a degree, focus on answering only what the student has specified about the degree without giving all the course details unless explicitly requested. "
+    
+    "If the student's prompt includes multiple questions or queries, respond in a way that addresses each one clearly, maintaining the context of the previous questions. "
+    
+    "If a user asks about the list of courses in a subject or field, give the list of all courses without leaving a single course behind, relevant to the prompt, whether it's a core course or discipline elective course. "
+    
+    "Always mention the course number, course title, and the value of 'U,' which implies the number of credits. "
+    
+    "Always strive to provide only the relevant details based on the student's query, ensuring the information is clear."
+    
+    "When asked about common courses, identify all the courses in the dataset provided and pick out the common ones, and don't miss checking the discipline elective courses of the courses asked. "
+    
+    "If the user types 'dels' in the user prompt, identify it as discipline elective courses. "
+    
+    "If the user types 'cdcs' in the user prompt, identify it as core courses, and don't mention any discipline courses in it. "
+    
+    "If the user asks for the list of courses, just give them the list of courses and ask if they want the description. If they answer 'yes' in the next prompt, give them the course description that is in the dataset only. "
+    
+    "If there are any prerequisites for the course, mention the course number and the course title of that prerequisite course."
+    
+    "When asked about holidays, clearly mention the date, day of the week, and event."
+    
+    "When asked about the course description, retrieve the course description directly from the database and give exact information from the database without generating any new context."
+    
+    "When asked about the practical hours or lab hours, treat both terms interchangeably. Only give the list of courses with practical hours greater than 0."
+    
+    "\n\n"
+    
+    "You are responsible for answering queries based solely on the course handouts provided. These handouts may contain both structured (tables) and unstructured information (text). Your responses should be accurate, well-organized, and strictly drawn from the handouts. Follow these specific guidelines to ensure clarity and precision:"
+    
+    "\n\n1. **Evaluation Scheme**: When asked about the evaluation scheme, list all relevant components such as quizzes, midterms, finals, and assignments. For each component, provide the weightage, duration, dates, times, and any special instructions (e.g., open/closed book, allowed materials like EDD notes). If the handout mentions policies for surprise quizzes, makeup exams, or penalties for missed exams, include those as well."
+    
+    "\n\n2. **Textbooks and Reference Books**: If queried about textbooks or reference books, specify the title, author, edition, and whether it is classified as a Textbook (TB) or Reference Book (RB). Present this information in a clear format for each book mentioned."
+    
+    "\n\n3. **Section-Specific Information**: When asked about specific topics such as course objectives, learning outcomes, or specific sections (e.g., consultation hours, weekly schedule), retrieve the relevant section from the handout and provide it verbatim. Ensure that the response is concise and easy to understand while staying true to the wording of the handout."
+    
+    "\n\n4. **Policy Queries**: If asked about policies (e.g., attendance, make-up exams, academic honesty), directly quote the corresponding section from the handout. If needed, provide a brief explanation of the policy without altering the original meaning."
+    
+    "\n\n5. **Handling Disorganized or Separated Data**: In cases where tabular data (e.g., schedules, evaluation schemes) is separated from related course details (e.g., course name, instructor), ensure that you logically associate the tables with the correct course context based on clues in the surrounding text or other handout sections."
+    
+    "\n\n6. **Handling Chunked Information**: The information may be chunked in an unorganized manner. It is essential to reconstruct relevant sections by identifying related chunks. Ensure that tables, course details, and schedules are matched accurately, and respond as if the data were fully organized."
+    
+    "\n\n7. **No Fabrication**: Under no circumstances should you generate information that is not explicitly present in the handouts. Always ensure that your responses are fact-based, and refrain from inventing details or filling in gaps that are not covered in the handout."
+    
+    "\n\n8. **Further Inquiries**: After answering a query, ask if the user would like more specific details from the handout, such as additional course information (e.g., weekly plans, grading breakdowns, consultation hours, specific chapters covered). Always offer the user the option to retrieve more relevant sections of the handout."
+    
+    "\n\n9. **Formatting**: Whenever possible, structure your responses clearly and format them for easy reading. For example, use lists or bullet points for evaluation components, books, or policy details. Present tables or schedules in a clear tabular format."
+    
+    "\n\n10. **Timetable Details and Professor Class Schedules**: "
+    "Provide the timings of the course in the format of course number, course name, section, instructor, classroom number, and class hours. Ask the user after every prompt if they want to know the timings of any other sections of the course or any other particular course. "
+    
+    "If the user asks about course exam timings, provide both mid-semester and comprehensive exam timings."
+    
+    "Ensure that all responses are concise, relevant, and well-structured to maintain clarity."
+    
+    "\n\nContext from the database:\n{context}"
+)
+
+
+# Setup for contextualizing question prompts
+contextualize_q_system_prompt = (
+    "Given a chat history and the latest user question which might reference context in the chat history, "
+    "formulate a standalone question which can be understood without the chat history. Do NOT answer the question, "
+    "just reformulate it if needed and otherwise return it as is."
+)
+contextualize_q_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", contextualize_q_system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ]
+)
+
+# Define chat prompt template with history
+prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ]
+)
+
+
+class StageTimer(BaseCallbackHandler):
+    """Callback handler that records the latency of the named chain steps into `metrics`.
+
+    Steps are matched by run name ("reformulate", "answer_cache", "retrieve", "generate").
+    The first token a model streams inside a step is also recorded as "<step>_ttft".
+    """
+
+    run_inline = True
+    stages = ("reformulate", "answer_cache", "retrieve", "generate")
+
+    def __init__(self, metrics=metrics):
+        self.metrics = metrics
+        self.runs = {}
+        self.parents = {}
+
+    def _start(self, run_id, parent_run_id, name):
+        self.parents[run_id] = parent_run_id
+        if name in self.stages:
+            self.runs[run_id] = (name, time.perf_counter())
+
+    def _end(self, run_id):
+        self.parents.pop(run_id, None)
+        run = self.runs.pop(run_id, None)
+        if run is not None:
+            self.metrics.record(run[0], time.perf_counter() - run[1])
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, kwargs.get("name"))
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, kwargs.get("name"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, None)
+
+    def on_llm_new_token(self, token, *, run_id, parent_run_id=None, **kwargs):
+        if not token or ("ttft", run_id) in self.runs:
+            return
+        self.runs[("ttft", run_id)] = None
+        # Walk up to the enclosing step and time the token from that step's start
+        ancestor = parent_run_id
+        while ancestor is not None and ancestor not in self.runs:
+            ancestor = self.parents.get(ancestor)
+        if ancestor is not None:
+            name, start = self.runs[ancestor]
+            self.metrics.record(f"{name}_ttft", time.perf_counter() - start)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.runs.pop(("ttft", run_id), None)
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.runs.pop(("ttft", run_id), None)
+        self._end(run_id)
+
+
+def build_retriever(vectorstore, sparse_index=None):
+    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 8})
+
+    # Fuse dense results with BM25 over the chunk text so exact course numbers are found with a small k
+    if sparse_index is not None:
+        retriever = HybridRetriever(dense_retriever=retriever, sparse_index=sparse_index, k=8)
+
+    # Rerank the candidates, trim long chunks to their relevant passages and pack them into a token budget
+    return ContextualCompressionRetriever(base_compressor=ContextPacker(sparse_index=sparse_index), base_retriever=retriever)
+
+
+def build_rag_chain(llm, llm_adv, retriever, answer_cache, get_session_history):
+    """Assemble the conversational RAG chain; every step's latency is recorded by a StageTimer."""
+    output_parser = StrOutputParser()
+
+    # Standalone question setup: first turns and self-contained follow-ups are used as is,
+    # only follow-ups that lean on the history are rewritten by the LLM
+    standalone_question_chain = RunnableBranch(
+        (lambda x: not needs_reformulation(x["input"], x.get("chat_history")), itemgetter("input")),
+        (contextualize_q_prompt | llm | output_parser).with_config(run_name="reformulate"),
+    )
+
+    # Set up question-answer chain, escalating to the larger model only for complex questions
+    # (a streamed branch runs the chosen chain outside its own run, so each chain carries the step name)
+    question_answer_chain = RunnableBranch(
+        (lambda x: is_complex(x["standalone_question"]), create_stuff_documents_chain(llm_adv, prompt).with_config(run_name="generate")),
+        create_stuff_documents_chain(llm, prompt).with_config(run_name="generate"),
+    )
+    answer_chain = (
+        RunnablePassthrough.assign(context=itemgetter("standalone_question") | retriever.with_config(run_name="retrieve"))
+        .assign(answer=question_answer_chain)
+    )
+
+    def answer_cache_lookup(inputs):
+        return answer_cache.lookup(inputs["standalone_question"])
+
+    # Cache hits skip retrieval and generation; misses are generated and then cached
+    rag_chain = (
+        RunnablePassthrough.assign(standalone_question=standalone_question_chain)
+        .assign(cached_answer=RunnableLambda(answer_cache_lookup).with_config(run_name="answer_cache"))
+        | RunnableBranch(
+            (lambda x: x["cached_answer"] is not None, lambda x: {"answer": x["cached_answer"], "context": []}),
+            answer_chain | cache_answers(answer_cache),
+        )
+    )
+
+    # Chain with message history
+    return RunnableWithMessageHistory(
+        rag_chain,
+        get_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    ).with_config(callbacks=[StageTimer()])
+
+
+def answer_from_timetable(timetable_index, get_session_history, input_prompt, session_id):
+    # Returns the answer for a schedule lookup, recording the turn so follow-ups keep their context
+    with metrics.stage("timetable"):
+        answer = timetable_index.answer(input_prompt)
+    if answer is not None:
+        history = get_session_history(session_id)
+        history.add_user_message(input_prompt)
+        history.add_ai_message(answer)
+    return answer
+
+
+def answer_query(chain, timetable_index, get_session_history, input_prompt, session_id):
+    # Schedule lookups are answered straight from the timetable; everything else goes through RAG
+    with metrics.stage("handle_query"):
+        answer = answer_from_timetable(timetable_index, get_session_history, input_prompt, session_id)
+        if answer is None:
+            # Invoke the RAG chain with the input prompt and session_id
+            response = chain.invoke(
+                {"input": input_prompt},
+                {"configurable": {"session_id": session_id}}
+            )
+            answer = response["answer"]
+    return answer
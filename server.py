@@ -0,0 +1,112 @@
+import json
+import asyncio
+import argparse
+from contextlib import aclosing
+
+# Upper bound on answers being generated at once across all sessions
+max_concurrency = 16
+
+
+class ChatServer:
+    """Streams answers for many concurrent chat sessions.
+
+    `chain` is anything with LangChain's `astream` that yields dicts carrying "answer" pieces,
+    such as `conversational_rag_chain`, so a chain built on a stub LLM can stand in for tests.
+    `answer_fn(input_prompt, session_id)` may answer a question directly (e.g. a timetable
+    lookup) and return None otherwise. Turns of one session run strictly in order, and at most
+    `max_concurrency` turns run at once.
+
+    Clients speak newline-delimited JSON over TCP: each request line is
+    {"session_id": ..., "input": ...} and the reply is a series of {"token": ...} lines
+    followed by {"done": true}, or {"error": ...} if the turn failed.
+    """
+
+    def __init__(self, chain, answer_fn=None, max_concurrency=max_concurrency):
+        self.chain = chain
+        self.answer_fn = answer_fn
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session_locks = {}
+        self.session_waiters = {}
+
+    async def _session_turn(self, session_id):
+        # Per-session lock that is dropped again once nobody is waiting on it
+        lock = self.session_locks.setdefault(session_id, asyncio.Lock())
+        self.session_waiters[session_id] = self.session_waiters.get(session_id, 0) + 1
+        try:
+            await lock.acquire()
+        except asyncio.CancelledError:
+            # The client went away while queued behind an earlier turn
+            self._drop_waiter(session_id)
+            raise
+        return lock
+
+    def _end_session_turn(self, session_id, lock):
+        lock.release()
+        self._drop_waiter(session_id)
+
+    def _drop_waiter(self, session_id):
+        self.session_waiters[session_id] -= 1
+        if self.session_waiters[session_id] == 0:
+            del self.session_waiters[session_id]
+            del self.session_locks[session_id]
+
+    async def stream_answer(self, input_prompt, session_id):
+        """Yield the answer to one turn piece by piece as it is generated."""
+        lock = await self._session_turn(session_id)
+        try:
+            async with self.semaphore:
+                answer = self.answer_fn(input_prompt, session_id) if self.answer_fn else None
+                if answer is not None:
+                    yield answer
+                    return
+                async for chunk in self.chain.astream(
+                    {"input": input_prompt},
+                    {"configurable": {"session_id": session_id}},
+                ):
+                    if chunk.get("answer"):
+                        yield chunk["answer"]
+        finally:
+            self._end_session_turn(session_id, lock)
+
+    async def handle_client(self, reader, writer):
+        async def send(message):
+            writer.write((json.dumps(message) + "\n").encode("utf-8"))
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    # aclosing releases the session lock right away if the client goes away mid-answer
+                    async with aclosing(self.stream_answer(request["input"], str(request["session_id"]))) as tokens:
+                        async for token in tokens:
+                            await send({"token": token})
+                    await send({"done": True})
+                except (ValueError, KeyError) as error:
+                    await send({"error": f"Bad request: {error}"})
+                except Exception as error:
+                    await send({"error": str(error)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the chatbot to many concurrent sessions over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-concurrency", type=int, default=max_concurrency)
+    args = parser.parse_args()
+
+    # Importing retriever builds the RAG chain and connects to the vector store
+    from retriever import conversational_rag_chain, answer_from_timetable
+
+    chat_server = ChatServer(conversational_rag_chain, answer_from_timetable, args.max_concurrency)
+    print(f"Serving on {args.host}:{args.port}")
+    asyncio.run(chat_server.serve(args.host, args.port))
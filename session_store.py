@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from tokens import count_tokens
+
+# Idle sessions expire after session_ttl seconds; session_db keeps histories across restarts
+session_ttl = float(os.getenv("session_ttl", "21600"))
+max_sessions = int(os.getenv("max_sessions", "10000"))
+history_token_budget = int(os.getenv("history_token_budget", "2000"))
+max_stored_messages = int(os.getenv("max_stored_messages", "40"))
+
+
+class BoundedChatMessageHistory(BaseChatMessageHistory):
+    """History of one session that only ever hands the prompts a token-budgeted window.
+
+    `messages` returns the most recent messages that fit in `max_tokens`, starting on a user
+    message, so the reformulation and answer prompts stop growing with every turn. At most
+    `max_messages` messages are stored per session.
+    """
+
+    def __init__(self, session_id, store, stored_messages=None, max_tokens=history_token_budget, max_messages=max_stored_messages):
+        self.session_id = session_id
+        self.store = store
+        self.stored_messages = stored_messages or []
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+
+    @property
+    def messages(self):
+        window, tokens = [], 0
+        stored = self.stored_messages
+        for i in range(len(stored) - 1, -1, -1):
+            message = stored[i]
+            message_tokens = count_tokens(message.content)
+            if tokens + message_tokens > self.max_tokens:
+                if not window:
+                    # A single oversized answer is cut down rather than dropped, and keeps the question it answers
+                    window = self._trimmed_turn(stored[i - 1] if i and message.type != "human" else None, message)
+                break
+            window.append(message)
+            tokens += message_tokens
+        window.reverse()
+        while window and window[0].type != "human":
+            window.pop(0)
+        return window
+
+    def _trimmed_turn(self, question, answer):
+        # Newest first, like the window being built; roughly four characters per token, at most half for the question
+        budget = self.max_tokens * 4
+        if question is None or question.type != "human":
+            return [answer.model_copy(update={"content": answer.content[:budget]})]
+        question_content = question.content[:budget // 2]
+        return [answer.model_copy(update={"content": answer.content[:budget - len(question_content)]}),
+                question.model_copy(update={"content": question_content})]
+
+    def add_messages(self, messages):
+        self.stored_messages.extend(messages)
+        del self.stored_messages[:-self.max_messages]
+        self.store.save(self)
+
+    def clear(self):
+        self.stored_messages = []
+        self.store.save(self)
+
+
+class SessionStore:
+    """Chat histories with idle-TTL expiry, LRU eviction and an optional SQLite backend.
+
+    At most `max_sessions` histories are kept in memory. Without `db_path`, an evicted
+    session is gone. With it, every change is written through to SQLite, so evicted
+    sessions and sessions from before a restart are reloaded on their next turn, until
+    they have been idle for `ttl` seconds.
+    """
+
+    def __init__(self, db_path=None, ttl=session_ttl, max_sessions=max_sessions,
+                 max_tokens=history_token_budget, max_messages=max_stored_messages):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_prune = 0.0
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, last_access REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+            self.db.commit()
+
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            self._prune(now)
+            entry = self.sessions.get(session_id)
+            if entry is not None:
+                self.sessions.move_to_end(session_id)
+                self.sessions[session_id] = (entry[0], now)
+                return entry[0]
+
+            history = BoundedChatMessageHistory(session_id, self, self._load(session_id), self.max_tokens, self.max_messages)
+            self.sessions[session_id] = (history, now)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return history
+
+    def _load(self, session_id):
+        if self.db is None:
+            return []
+        row = self.db.execute("SELECT messages FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return messages_from_dict(json.loads(row[0])) if row else []
+
+    def save(self, history):
+        if self.db is None:
+            return
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (history.session_id, json.dumps(messages_to_dict(history.stored_messages)), time.time()),
+            )
+            self.db.commit()
+
+    def _prune(self, now):
+        # Sessions are ordered by last access, so expired ones are always at the front
+        while self.sessions:
+            session_id, (_, last_access) = next(iter(self.sessions.items()))
+            if now - last_access <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+        if self.db is not None and now - self.last_prune > 60:
+            self.db.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl,))
+            self.db.commit()
+            self.last_prune = now
+
+    def __len__(self):
+        return len(self.sessions)
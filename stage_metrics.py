@@ -0,0 +1,65 @@
+import os
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Worker processes of extraction.py import this module, so it must stay free of heavy imports; numpy is only loaded by summary().
+# Percentiles come from the most recent stage_metrics_samples samples of each stage, counts and totals cover every sample.
+max_samples = int(os.getenv("stage_metrics_samples", "10000"))
+
+
+class StageMetrics:
+    """In-process latency samples per pipeline stage, e.g. "embed_batch" or "generate_ttft".
+
+    Recording a sample is a perf_counter call and an append to a bounded deque, so the hooks
+    stay on in production at a fixed memory cost; `summary` turns the recent samples into
+    p50/p99 latencies and the running totals into serial throughput.
+    """
+
+    def __init__(self, max_samples=max_samples):
+        self.samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self.totals = defaultdict(lambda: [0, 0.0])
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds, count=1):
+        # count > 1 records one sample per item for work timed as a batch, e.g. the pages of one extraction task
+        with self.lock:
+            self.samples[stage].extend([seconds / count] * min(count, self.samples[stage].maxlen))
+            totals = self.totals[stage]
+            totals[0] += count
+            totals[1] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.totals.clear()
+
+    def summary(self):
+        import numpy as np
+
+        with self.lock:
+            samples = {stage: (np.array(values), tuple(self.totals[stage])) for stage, values in self.samples.items() if values}
+        report = {}
+        for stage, (values, (count, total)) in sorted(samples.items()):
+            report[stage] = {
+                "count": count,
+                "p50_ms": round(float(np.percentile(values, 50)) * 1000, 3),
+                "p99_ms": round(float(np.percentile(values, 99)) * 1000, 3),
+                "mean_ms": round(total / count * 1000, 3),
+                "total_s": round(total, 4),
+                "per_s": round(count / total, 2) if total else None,
+            }
+        return report
+
+
+# Shared by every module in the process; benchmark.py resets and reads it
+metrics = StageMetrics()
@@ -0,0 +1,144 @@
+import os
+import json
+
+# Tables pulled out of the PDFs by preprocessing.py, saved by vectordb.py next to the other indexes
+table_store_path = os.getenv("table_store_path", "table_store.json")
+
+# Characters per table chunk; a table longer than this is split into row groups, each repeating the header
+table_chunk_size = 1500
+
+
+class Table:
+    """One logical table stored column by column, possibly continued over several pages.
+
+    `page` is the page the table starts on and `index` its position among the tables of its
+    source file. Row cells are read across the columns, so a row is never stored twice.
+    """
+
+    def __init__(self, source, page, index, header, columns):
+        self.source = source
+        self.page = page
+        self.index = index
+        self.header = header
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, source, page, index, header, rows):
+        columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in header]
+        return cls(source, page, index, header, columns)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def rows(self, start=0, stop=None):
+        return [list(row) for row in zip(*(column[start:stop] for column in self.columns))]
+
+    def row(self, i):
+        return dict(zip(self.header, (column[i] for column in self.columns)))
+
+    def extend(self, rows):
+        for column, cells in zip(self.columns, zip(*rows)):
+            column.extend(cells)
+
+    @property
+    def title(self):
+        return f"Table {self.index + 1} in {os.path.basename(self.source)}, page {self.page}"
+
+    def chunks(self, max_chars=table_chunk_size):
+        """Split the table into (first_row, text) row groups, each starting with the title and header."""
+        head = f"{self.title}\n{' - '.join(self.header)}"
+        groups, lines, first_row, size = [], [], 0, len(head)
+        for i, row in enumerate(self.rows()):
+            line = " - ".join(row)
+            if lines and size + len(line) + 1 > max_chars:
+                groups.append((first_row, "\n".join([head] + lines)))
+                lines, first_row, size = [], i, len(head)
+            lines.append(line)
+            size += len(line) + 1
+        groups.append((first_row, "\n".join([head] + lines)))
+        return groups
+
+    def to_dict(self):
+        return {"source": self.source, "page": self.page, "index": self.index, "header": self.header, "columns": self.columns}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["source"], data["page"], data["index"], data["header"], data["columns"])
+
+
+class TableStore:
+    """Extracted tables keyed by (source, page), with row lookups that never go through the LLM.
+
+    `select` filters rows by header and cell substrings, e.g.
+    `store.select({"component": "mid"}, source="dataset/handouts/EMT.pdf")` returns the
+    midsem rows of that handout's evaluation scheme.
+    """
+
+    def __init__(self, tables=()):
+        self.tables = {}
+        for table in tables:
+            self.add(table)
+
+    @classmethod
+    def load(cls, path=table_store_path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as f:
+            return cls(Table.from_dict(data) for data in json.load(f))
+
+    def save(self, path=table_store_path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([table.to_dict() for table in self], f)
+        os.replace(tmp_path, path)
+
+    def add(self, table):
+        self.tables.setdefault((table.source, table.page), []).append(table)
+
+    def remove_sources(self, sources):
+        for key in [key for key in self.tables if key[0] in sources]:
+            del self.tables[key]
+
+    def sources(self):
+        return {source for source, _ in self.tables}
+
+    def tables_for(self, source=None, page=None):
+        return [table for (table_source, table_page), tables in self.tables.items() for table in tables
+                if (source is None or table_source == source) and (page is None or table_page == page)]
+
+    def select(self, where=None, source=None, contains=None):
+        """Return (table, row) pairs with each row as a header-to-cell dict.
+
+        `where` maps header substrings to cell substrings and `contains` must appear in some
+        cell; all matching is case-insensitive.
+        """
+        where = {key.lower(): value.lower() for key, value in (where or {}).items()}
+        contains = contains.lower() if contains else None
+        matches = []
+        for table in self.tables_for(source):
+            headers = [name.lower() for name in table.header]
+            # Every condition needs a matching column, otherwise the table is skipped
+            columns = {}
+            for key in where:
+                columns[key] = [i for i, name in enumerate(headers) if key in name]
+            if not all(columns.values()):
+                continue
+            for i, row in enumerate(table.rows()):
+                cells = [cell.lower() for cell in row]
+                if contains and not any(contains in cell for cell in cells):
+                    continue
+                if all(any(value in cells[j] for j in columns[key]) for key, value in where.items()):
+                    matches.append((table, table.row(i)))
+        return matches
+
+    def column(self, name, source=None):
+        """Cells of every column whose header contains `name`, in table order."""
+        name = name.lower()
+        return [cell for table in self.tables_for(source) for header, column in zip(table.header, table.columns)
+                if name in header.lower() for cell in column]
+
+    def __iter__(self):
+        return (table for tables in self.tables.values() for table in tables)
+
+    def __len__(self):
+        return sum(len(tables) for tables in self.tables.values())
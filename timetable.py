@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import datetime
+from collections import defaultdict
+
+timetable_path = os.path.join("dataset", "timetable.json")
+
+_course_code = re.compile(r"\b([A-Za-z]{2,5})\s*([A-Za-z])\s*(\d{3}[A-Za-z]?)\b")
+_section = re.compile(r"\b([LTPltp])\s?(\d{1,2})\b")
+_room = re.compile(r"\b([A-Ka-k]\d{3}[A-Za-z]?)\b")
+_hour = re.compile(r"\bhours?\s*(\d{1,2})\b|\b(\d{1,2})(?:st|nd|rd|th)\s+hour\b")
+_numeric_date = re.compile(r"\b(\d{1,2})[/-](\d{1,2})\b")
+_months = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_day_month = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(" + "|".join(_months) + r")[a-z]*\b")
+_month_day = re.compile(r"\b(" + "|".join(_months) + r")[a-z]*\s+(\d{1,2})(?:st|nd|rd|th)?\b")
+
+day_labels = {"M": "Monday", "T": "Tuesday", "W": "Wednesday", "Th": "Thursday", "F": "Friday", "S": "Saturday"}
+day_names = {"mon": "M", "tue": "T", "tues": "T", "wed": "W", "thu": "Th", "thur": "Th", "thurs": "Th", "fri": "F", "sat": "S"}
+day_names.update({label.lower(): code for code, label in day_labels.items()})
+_day = re.compile(r"\b(" + "|".join(sorted(day_names, key=len, reverse=True)) + r")\b")
+section_kinds = {"L": "Lecture", "T": "Tutorial", "P": "Practical"}
+
+# Words that decide whether a question is a timetable lookup at all
+exam_words = {"midsem", "midsems", "mid-sem", "compre", "compres", "comprehensive", "exam", "exams", "test", "endsem"}
+teacher_words = {"instructor", "instructors", "ic", "professor", "prof", "faculty", "teacher", "teaches"}
+# "taught"/"teaching" alone are about content ("what is taught in ..."), so they only count after "who" or before "by"
+_teacher_phrase = re.compile(r"\bwho\b.*\b(?:teach|teaching|taught|takes|taking)\b|\btaught by\b")
+schedule_words = {"when", "time", "timing", "timings", "schedule", "class", "classes", "room", "where", "hour", "hours",
+                  "lecture", "lectures", "tutorial", "tutorials", "lab", "labs", "practical", "practicals", "section",
+                  "sections", "slot", "slots", "day", "days", "timetable"}
+# Anything about course content belongs to the handouts and bulletin, so it goes through RAG
+rag_words = {"handout", "evaluation", "textbook", "textbooks", "book", "books", "syllabus", "description", "prerequisite",
+             "prerequisites", "objective", "objectives", "policy", "minor", "elective", "electives", "dels", "cdcs",
+             "grading", "weightage", "compare", "topics", "chapter", "chapters", "marks", "component", "components",
+             "makeup", "makeups", "make-up", "portion", "portions", "pattern", "contact", "duration", "open-book",
+             "closed-book"}
+# Exam rules such as make-ups and open-book papers are in the handouts, not the timetable
+rag_phrases = ("make up", "open book", "closed book")
+
+follow_up = "Would you like the timings of any other section of this course or of any other course?"
+
+
+def normalize_code(department, letter, number):
+    return f"{department.upper()} {letter.upper()}{number.upper()}"
+
+
+class TimetableIndex:
+    """In-memory timetable with lookups by course number, instructor, room, day/hour and exam date.
+
+    `answer` turns common schedule questions into direct answers so they never reach the LLM.
+    """
+
+    def __init__(self, timetable_data):
+        self.acad_year = timetable_data.get("metadata", {}).get("acadYear", datetime.date.today().year)
+        self.courses = {}
+        self.by_instructor = defaultdict(list)
+        self.instructor_tokens = defaultdict(set)
+        self.by_room = defaultdict(list)
+        self.by_slot = defaultdict(list)
+        self.by_exam_date = defaultdict(list)
+
+        for course_no, course_info in timetable_data["courses"].items():
+            match = _course_code.fullmatch(course_no.strip())
+            if match is None:
+                continue
+            code = normalize_code(*match.groups())
+            self.courses[code] = course_info
+
+            for section, section_info in course_info["sections"].items():
+                for name in dict.fromkeys(instructor.strip().lower() for instructor in section_info["instructor"]):
+                    self.by_instructor[name].append((code, section))
+                    for token in name.split():
+                        self.instructor_tokens[token].add(name)
+                for schedule in section_info["schedule"]:
+                    self.by_room[schedule["room"].upper()].append((code, section, schedule["days"], schedule["hours"]))
+                    for day in schedule["days"]:
+                        for hour in schedule["hours"]:
+                            self.by_slot[(day, hour)].append((code, section, schedule["room"]))
+
+            for exam in ("midsem", "compre"):
+                when = course_info["exams_iso"][0].get(exam) if course_info.get("exams_iso") else None
+                if when:
+                    date = datetime.date.fromisoformat(when[:10])
+                    self.by_exam_date[date].append((code, exam, course_info["exams"][0][exam]))
+
+    @classmethod
+    def load(cls, path=timetable_path):
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    # Lookups
+
+    def course(self, code):
+        return self.courses.get(code)
+
+    def instructors_in(self, question):
+        # Instructor names whose every word appears in the question
+        words = set(re.findall(r"[a-z.]+", question.lower()))
+        candidates = set()
+        for word in words:
+            candidates |= self.instructor_tokens.get(word, set())
+        return sorted(name for name in candidates if len(name.split()) > 1 and set(name.split()) <= words)
+
+    def sections_for_instructor(self, name):
+        return self.by_instructor.get(name.lower(), [])
+
+    def classes_in_room(self, room, day=None, hour=None):
+        return [(code, section, days, hours) for code, section, days, hours in self.by_room.get(room.upper(), [])
+                if (day is None or day in days) and (hour is None or hour in hours)]
+
+    def classes_at(self, day, hour):
+        return self.by_slot.get((day, hour), [])
+
+    def exams_on(self, date):
+        return self.by_exam_date.get(date, [])
+
+    # Formatting
+
+    def _title(self, code):
+        info = self.courses[code]
+        course_name = " ".join(info["course_name"].split())
+        return f"{code} - {course_name} ({info['units']} units)"
+
+    @staticmethod
+    def _schedule_text(schedule):
+        days = ", ".join(day_labels.get(day, day) for day in schedule["days"])
+        hours = ", ".join(str(hour) for hour in schedule["hours"])
+        return f"Room {schedule['room']}, {days}, hour {hours}"
+
+    def format_sections(self, code, sections=None, kinds=None, with_schedule=True):
+        lines = [self._title(code)]
+        for section, section_info in self.courses[code]["sections"].items():
+            if (sections and section not in sections) or (kinds and section[0] not in kinds):
+                continue
+            line = f"- Section {section} ({section_kinds.get(section[0], 'Section')}): {', '.join(section_info['instructor'])}"
+            if with_schedule:
+                line += "; " + "; ".join(self._schedule_text(schedule) for schedule in section_info["schedule"])
+            lines.append(line)
+        if len(lines) == 1:
+            # Nothing matched the section or kind filters, so the question is left to RAG
+            return None
+        return "\n".join(lines)
+
+    def format_exams(self, code):
+        exams = self.courses[code]["exams"][0]
+        midsem = exams.get("midsem") or "not scheduled in the timetable"
+        compre = exams.get("compre") or "not scheduled in the timetable"
+        return f"{self._title(code)}\n- Midsem: {midsem}\n- Compre: {compre}"
+
+    # Question answering
+
+    def _parse_date(self, text):
+        match = _numeric_date.search(text)
+        if match:
+            day, month = int(match.group(1)), int(match.group(2))
+        else:
+            match = _day_month.search(text)
+            if match:
+                day, month = int(match.group(1)), _months.index(match.group(2)) + 1
+            else:
+                match = _month_day.search(text)
+                if not match:
+                    return None
+                day, month = int(match.group(2)), _months.index(match.group(1)) + 1
+        # The academic year starts in August, so January to July fall in the next calendar year
+        year = self.acad_year if month >= 8 else self.acad_year + 1
+        try:
+            return datetime.date(year, month, day)
+        except ValueError:
+            return None
+
+    def answer(self, question):
+        """Answer a schedule lookup directly from the index, or return None so the question goes to RAG."""
+        text = question.lower()
+        words = set(re.findall(r"[a-z0-9-]+", text))
+        if words & rag_words or any(phrase in text for phrase in rag_phrases):
+            return None
+        exam_intent = bool(words & exam_words) or "mid sem" in text
+        teacher_intent = bool(words & teacher_words) or bool(_teacher_phrase.search(text))
+        schedule_intent = bool(words & schedule_words)
+
+        codes = [normalize_code(*parts) for parts in _course_code.findall(question)]
+        codes = [code for code in dict.fromkeys(codes) if code in self.courses]
+        if codes:
+            if exam_intent:
+                return "\n\n".join(self.format_exams(code) for code in codes)
+            sections = {f"{kind.upper()}{number}" for kind, number in _section.findall(question)}
+            if not (teacher_intent or schedule_intent or sections):
+                return None
+            kinds = {kind for word, kind in (("lecture", "L"), ("tutorial", "T"), ("practical", "P"), ("lab", "P")) if word in text}
+            answers = [self.format_sections(code, sections, kinds, with_schedule=schedule_intent or not teacher_intent) for code in codes]
+            if None in answers:
+                return None
+            answer = "\n\n".join(answers)
+            return f"{answer}\n\n{follow_up}"
+
+        # Without a course number the question must name a room, an instructor, an exam date or a slot
+        # Drop words that only look like course numbers ("room G205") but keep the room itself
+        text = _course_code.sub(lambda match: " " if normalize_code(*match.groups()) in self.courses else match.group(0), text)
+        day_match = _day.search(text)
+        day = day_names[day_match.group(1)] if day_match else None
+        hour_match = _hour.search(text)
+        hour = int(hour_match.group(1) or hour_match.group(2)) if hour_match else None
+
+        if exam_intent:
+            date = self._parse_date(text)
+            if date is None:
+                return None
+            exams = self.exams_on(date)
+            if not exams:
+                return f"No midsem or compre exams are scheduled on {date:%d %B %Y} in the timetable."
+            lines = [f"Exams on {date:%d %B %Y}:"]
+            lines += [f"- {self._title(code)}: {exam.capitalize()} {when}" for code, exam, when in sorted(exams)]
+            return "\n".join(lines)
+
+        rooms = [room.upper() for room in _room.findall(text) if room.upper() in self.by_room]
+        if rooms and (schedule_intent or "room" in text):
+            lines = []
+            for room in rooms:
+                classes = self.classes_in_room(room, day, hour)
+                lines.append(f"Classes in room {room}" + (f" on {day_labels[day]}" if day else "") + (f" in hour {hour}" if hour else "") + ":")
+                for code, section, days, hours in classes:
+                    lines.append(f"- {self._title(code)}, section {section}: {', '.join(day_labels.get(d, d) for d in days)}, hour {', '.join(map(str, hours))}")
+                if not classes:
+                    lines.append("- None in the timetable.")
+            return "\n".join(lines)
+
+        instructors = self.instructors_in(question)
+        if instructors and (schedule_intent or teacher_intent):
+            lines = []
+            for name in instructors:
+                lines.append(f"Sections taught by {name.title()}:")
+                for code, section in self.sections_for_instructor(name):
+                    schedule = self.courses[code]["sections"][section]["schedule"]
+                    lines.append(f"- {self._title(code)}, section {section}: " + "; ".join(self._schedule_text(s) for s in schedule))
+            return "\n".join(lines)
+
+        if day and hour and schedule_intent:
+            classes = self.classes_at(day, hour)
+            lines = [f"Classes on {day_labels[day]} in hour {hour}:"]
+            lines += [f"- {self._title(code)}, section {section}, room {room}" for code, section, room in sorted(classes)]
+            if not classes:
+                lines.append("- None in the timetable.")
+            return "\n".join(lines)
+
+        return None
@@ -0,0 +1,13 @@
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # Fall back to the usual four-characters-per-token estimate
+    _encoding = None
+
+
+def count_tokens(text):
+    # Shared by ingestion batching and the chat-time history and context budgets
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
@@ -1,5 +1,6 @@
 import os
 import time
+import argparse
 from dotenv import load_dotenv
 import pinecone
 from pinecone import Pinecone
@@ -10,49 +11,44 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from pinecone.grpc import PineconeGRPC as Pinecone
 from pinecone import ServerlessSpec
-from preprocessing import create_documents_with_labels
+from embedding_cache import CachedEmbeddings
+from local_index import LocalVectorIndex, LocalVectorStore
+from indexing import index_dataset
 
 load_dotenv()
 pinecone_api_key = os.getenv("pinecone_api")
 openai_api_key = os.getenv("openai_api")
 
-pc = Pinecone(api_key=pinecone_api_key)
+# "pinecone" (default) or "local" for the on-disk index in local_index.py
+vector_backend = os.getenv("vector_backend", "pinecone")
 
-index_name = "gpt"
+# Chunks that were embedded before are served from the local cache
+embeddings = CachedEmbeddings(OpenAIEmbeddings(api_key=openai_api_key,model = "text-embedding-3-large"))
 
-pcindex = pc.Index(name = "qpt",host="https://gpt-vd1mwjl.svc.aped-4627-b74a.pinecone.io")
+if vector_backend == "local":
+    pcindex = LocalVectorIndex()
+    vectorstore = LocalVectorStore(index=pcindex, embedding=embeddings)
+    index_target = {"backend": "local", "location": os.path.abspath(pcindex.index_dir)}
+else:
+    pc = Pinecone(api_key=pinecone_api_key)
 
-embeddings = OpenAIEmbeddings(api_key=openai_api_key,model = "text-embedding-3-large")
-vectorstore = PineconeVectorStore(index= pcindex,embedding= embeddings)
+    index_name = "gpt"
+    index_host = "https://gpt-vd1mwjl.svc.aped-4627-b74a.pinecone.io"
 
-text_splitter = RecursiveCharacterTextSplitter()
-
-def create_embeddings(documents):
-    return embeddings.embed_documents([doc.page_content for doc in documents])
+    pcindex = pc.Index(name = "qpt",host=index_host)
+    vectorstore = PineconeVectorStore(index= pcindex,embedding= embeddings)
+    index_target = {"backend": "pinecone", "location": index_host}
 
-def store_embeddings(documents, embeddings, batch_size=100):
-    pinecone_data = [
-        {
-            "id": doc.metadata["label"],
-            "values": embedding,
-            "metadata": {"text": doc.page_content}
-        }
-        for doc, embedding in zip(documents, embeddings)
-    ]
-
-    # Process in batches
-    for i in range(0, len(pinecone_data), batch_size):
-        batch = pinecone_data[i:i + batch_size]
-        pcindex.upsert(vectors=batch)
+text_splitter = RecursiveCharacterTextSplitter()
 
 # Example usage in the main execution
 if __name__ == "__main__":
-    labeled_chunks = create_documents_with_labels()
-    chunk_documents = [Document(page_content=chunk["content"], metadata={"label": chunk["label"]}) for chunk in labeled_chunks]
-    chunk_embeddings = create_embeddings(chunk_documents)
-    store_embeddings(chunk_documents, chunk_embeddings, batch_size=100)
-
-    
-    print("All documents stored in Pinecone with labels.")
-
-
+    parser = argparse.ArgumentParser(description="Index the dataset into Pinecone, re-embedding only what changed.")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-index every file")
+    args = parser.parse_args()
+
+    report = index_dataset(embeddings, pcindex, index_target, full=args.full)
+    print(f"{report['files_extracted']} files re-extracted, {report['chunks_embedded']} changed chunks embedded, "
+          f"{report['duplicates_embedded']} former duplicates embedded, {report['new_duplicates']} new near-duplicate chunks skipped, "
+          f"{report['stale_deleted']} stale vectors deleted.")
+    print(f"The index now holds {report['index_chunks']} chunks, with {report['index_duplicates']} near-duplicates recorded against them.")